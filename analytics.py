@@ -0,0 +1,153 @@
+"""
+Spending summary — per-member, per-category and per-day totals (/api/summary).
+
+Replaces the group and per-member totals the Split tab used to recompute
+from every expense on each render. Each trip that has been asked for a
+summary keeps its rollups in memory and, like the ledgers in settlement.py,
+updates them from the docpatch ops of every save (see derived.py); anything
+touching /tripCurrency rebuilds them.
+
+Amounts are converted to the trip's base currency at the rate of the day
+the expense was made, from the dated rate provider (fxrates.py), falling
+back to tripCurrency.rates and then to the face value, as toBase() does.
+A full rebuild looks each rate up once per (currency, date) rather than
+once per expense; it also runs whenever the provider's rates change.
+"""
+from collections import defaultdict
+from derived import SectionView, ViewBook
+
+_EPS = 0.005
+
+
+def _num(x) -> float:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _Contribution:
+    __slots__ = ("amount", "paid", "share", "category", "day", "currency", "original", "unpriced")
+
+    def __init__(self, item: dict, rate: float, unpriced: bool):
+        self.original = _num(item.get("amount"))
+        self.amount   = self.original * rate
+        self.currency = item.get("currency")
+        self.category = item.get("category") or "other"
+        self.day      = item.get("date") or ""
+        self.unpriced = unpriced
+        payments      = item.get("payments")
+        if isinstance(payments, dict) and payments:
+            self.paid = {mid: _num(v) * rate for mid, v in payments.items()}
+        else:
+            self.paid = {item.get("paidBy"): self.amount}
+        self.share = {mid: _num(v) * rate for mid, v in (item.get("splits") or {}).items()}
+
+
+class Summary(SectionView):
+    REBUILD_ON = ("tripCurrency",)
+
+    def __init__(self, rates):
+        self.fx_version = None
+        self.base       = "SGD"
+        self._rates     = rates
+        self._static    = {}
+        self._memo      = None      # (currency, date) → rate, during a rebuild
+        self._clear()
+        super().__init__()
+
+    def _clear(self):
+        self.count      = 0
+        self.total      = 0.0
+        self.paid       = defaultdict(float)
+        self.share      = defaultdict(float)
+        self.categories = defaultdict(float)
+        self.days       = defaultdict(float)
+        self.currencies = defaultdict(lambda: [0.0, 0.0])   # currency → [original amount, in base]
+        self.unpriced   = defaultdict(int)                  # currency → expenses counted at face value
+        self._contrib   = {}                                # expense id → _Contribution
+
+    # ── Contributions ─────────────────────────────────────────────────────────
+
+    def _rate(self, currency, date) -> tuple:
+        """(rate into base, whether no rate was found and the face value is used)."""
+        if currency == self.base:
+            return 1.0, False
+        if self._memo is not None and (currency, date) in self._memo:
+            return self._memo[(currency, date)]
+        rate = self._rates.rate(currency, self.base, date) or self._static.get(currency)
+        out  = (rate, False) if rate else (1.0, True)
+        if self._memo is not None:
+            self._memo[(currency, date)] = out
+        return out
+
+    def _post(self, c: _Contribution, sign: int):
+        self.count += sign
+        self.total += sign * c.amount
+        for mid, amt in c.paid.items():
+            self.paid[mid] += sign * amt
+        for mid, amt in c.share.items():
+            self.share[mid] += sign * amt
+        self.categories[c.category] += sign * c.amount
+        self.days[c.day]            += sign * c.amount
+        totals     = self.currencies[c.currency]
+        totals[0] += sign * c.original
+        totals[1] += sign * c.amount
+        if c.unpriced:
+            self.unpriced[c.currency] += sign
+
+    def _add(self, section: str, key, item: dict):
+        c = self._contrib[key] = _Contribution(item, *self._rate(item.get("currency"), item.get("date")))
+        self._post(c, 1)
+
+    def _drop(self, section: str, key):
+        c = self._contrib.pop(key, None)
+        if c is not None:
+            self._post(c, -1)
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def _reset(self, data: dict):
+        fx              = data.get("tripCurrency") or {}
+        self.base       = fx.get("base") or "SGD"
+        self._static    = {k: _num(v) for k, v in (fx.get("rates") or {}).items()}
+        self.fx_version = self._rates.version
+        self._clear()
+
+    def rebuild(self, data: dict):
+        self._memo = {}
+        try:
+            super().rebuild(data)
+        finally:
+            self._memo = None
+
+    def current(self, data: dict) -> bool:
+        return super().current(data) and self.fx_version == self._rates.version
+
+    # ── Output ────────────────────────────────────────────────────────────────
+
+    def summary(self, members: list) -> dict:
+        members_out = {m.get("id"): {"paid": 0.0, "share": 0.0} for m in members if isinstance(m, dict)}
+        for mid in set(self.paid) | set(self.share):
+            paid, share = self.paid.get(mid, 0.0), self.share.get(mid, 0.0)
+            if mid is not None and (mid in members_out or abs(paid) > _EPS or abs(share) > _EPS):
+                members_out[mid] = {"paid": round(paid, 2), "share": round(share, 2)}
+        return {
+            "base":       self.base,
+            "count":      self.count,
+            "total":      round(self.total, 2),
+            "members":    members_out,
+            "categories": {k: round(v, 2) for k, v in sorted(self.categories.items(), key=lambda kv: -kv[1])
+                           if abs(v) > _EPS},
+            "days":       {k: round(v, 2) for k, v in sorted(self.days.items()) if abs(v) > _EPS},
+            "currencies": {k: {"amount": round(a, 2), "base": round(b, 2)}
+                           for k, (a, b) in self.currencies.items() if abs(a) > _EPS or abs(b) > _EPS},
+            "unpriced":   sorted(str(k) for k, n in self.unpriced.items() if n > 0),
+        }
+
+
+class SummaryBook(ViewBook):
+    """Summaries for the chats that have asked for one, kept current by store updates."""
+
+    def __init__(self, rates):
+        super().__init__(lambda: Summary(rates), rates)
@@ -0,0 +1,101 @@
+"""
+Front-end assets, built once at startup and served from memory.
+
+static/index.html carries the whole Mini App, CSS and JS inline. AssetBundle
+splits every inline <style> and <script> block out into its own file named
+after its content hash (app.3f9c2a1b7d04.js), leaving a small HTML shell that
+links to them:
+
+    GET /                  the shell     Cache-Control: no-cache, ETag
+    GET /assets/<name>     JS / CSS      Cache-Control: immutable for a year
+
+so Telegram's webview revalidates a couple of kilobytes on every open and
+only downloads the bundle again after a deploy that changed it. Each file is
+held gzip-compressed — and brotli-compressed when the optional brotli package
+is installed — next to the original, and the variant is picked from
+Accept-Encoding per request without compressing anything on the fly. Every
+variant has its own strong ETag.
+"""
+import hashlib, re
+from pathlib import Path
+from starlette.responses import Response
+from compression import ENCODINGS, compress as _compress, pick_encoding
+
+IMMUTABLE    = "public, max-age=31536000, immutable"
+MIN_COMPRESS = 1024     # bytes; smaller bodies are sent as they are
+
+# Inline blocks only: <script src=…> and <link> tags are left where they are
+_INLINE = re.compile(r"<style>(.*?)</style>|<script>(.*?)</script>", re.S)
+
+
+def compress(body: bytes) -> dict:
+    """{encoding: bytes} for each encoding that makes body smaller, at the best ratio."""
+    if len(body) < MIN_COMPRESS:
+        return {}
+    out = {enc: _compress(body, enc, best=True) for enc in ENCODINGS}
+    return {enc: data for enc, data in out.items() if len(data) < len(body)}
+
+
+def _tag_matches(header: str, etag: str) -> bool:
+    return any(t.strip().removeprefix("W/") in (etag, "*") for t in header.split(","))
+
+
+class Asset:
+    __slots__ = ("body", "media_type", "tag", "encoded")
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body       = body
+        self.media_type = media_type
+        self.tag        = hashlib.sha256(body).hexdigest()[:12]
+        self.encoded    = compress(body)
+
+    def etag(self, encoding=None) -> str:
+        return f'"{self.tag}-{encoding}"' if encoding else f'"{self.tag}"'
+
+    def response(self, headers, cache_control: str) -> Response:
+        """The variant the request accepts, or 304 if the client already has it."""
+        encoding = pick_encoding(headers.get("accept-encoding", ""), self.encoded)
+        out      = {"ETag": self.etag(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        inm      = headers.get("if-none-match")
+        if inm and _tag_matches(inm, out["ETag"]):
+            return Response(status_code=304, headers=out)
+        if encoding:
+            out["Content-Encoding"] = encoding
+            return Response(self.encoded[encoding], media_type=self.media_type, headers=out)
+        return Response(self.body, media_type=self.media_type, headers=out)
+
+
+class AssetBundle:
+    def __init__(self, index_path, prefix: str = "/assets"):
+        self.index_path = Path(index_path)
+        self.prefix     = prefix
+        self.files: dict = {}       # name → Asset
+        self.shell       = None
+        self.build()
+
+    def build(self):
+        """(Re)read index_path and rebuild the shell and its files."""
+        files, counts = {}, {}
+
+        def split_out(m) -> str:
+            css   = m.group(1) is not None
+            ext   = "css" if css else "js"
+            n     = counts[ext] = counts.get(ext, -1) + 1
+            body  = (m.group(1) if css else m.group(2)).encode()
+            asset = Asset(body, "text/css; charset=utf-8" if css else "text/javascript; charset=utf-8")
+            name  = f"app{n or ''}.{asset.tag}.{ext}"
+            files[name] = asset
+            url = f"{self.prefix}/{name}"
+            return f'<link rel="stylesheet" href="{url}">' if css else f'<script src="{url}"></script>'
+
+        html       = _INLINE.sub(split_out, self.index_path.read_text(encoding="utf-8"))
+        self.files = files
+        self.shell = Asset(html.encode(), "text/html; charset=utf-8")
+
+    def get(self, name: str):
+        return self.files.get(name)
+
+    def stats(self) -> dict:
+        return {"shell_bytes": len(self.shell.body), "encodings": list(ENCODINGS),
+                "files": {name: {"bytes": len(a.body), **{enc: len(b) for enc, b in a.encoded.items()}}
+                          for name, a in self.files.items()}}
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the HTTP API and webhook under concurrent load, fully offline.
+
+Generates synthetic trips shaped like data/trip__1003724580501.json (days
+with stops, weather locations, checklists, Info Board refs) plus members,
+expenses and settlements, in sizes set on the command line. The app runs
+in-process behind httpx's ASGI transport, with its Bot API calls going to a
+stub on localhost, and each route is driven on its own by `--concurrency`
+clients sending `--requests` requests in total:
+
+    get_data     GET  /api/data                 (no If-None-Match: full body every time)
+    post_data    POST /api/data                 whole trip, one field changed
+    patch_data   POST /api/data/patch           one expense added
+    is_admin     GET  /api/is_admin
+    upload       POST /api/upload               raw body of --upload-kb random bytes
+    webhook      POST /webhook                  /myid updates, replies go to the stub
+
+Every chat is loaded once before timing starts. Prints throughput and
+p50/p95/p99/max latency per route and writes them with the run's settings
+to a JSON results file; --compare prints the change against an earlier one.
+
+Run: python3 bench_api.py [--chats N] [--days N] [--expenses N] [--concurrency N]
+                          [--requests N] [--out bench_results.json] [--compare old.json]
+"""
+import argparse, asyncio, json, logging, os, platform, random, socket, subprocess, sys, tempfile, time
+from pathlib import Path
+
+REPO   = Path(__file__).resolve().parent
+SECRET = "bench"
+ROUTES = ("get_data", "post_data", "patch_data", "is_admin", "upload", "webhook")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+# ── Synthetic trips ───────────────────────────────────────────────────────────
+
+_PLACES = ["Madrid", "Burgos", "Potes", "Cangas de Onís", "Arenas de Cabrales", "Poncebos",
+           "Fuente Dé", "Valdesquí", "Segovia", "León", "Oviedo", "Santander"]
+_WORDS  = ("trail hike drive lunch dinner fuel parking tickets cable car refuge gear snacks "
+           "coffee museum market beach viewpoint ferry pass rental").split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize()
+
+
+def make_trip(rng: random.Random, days: int, stops: int, expenses: int, refs: int, members: int) -> dict:
+    from schema import default_data
+    trip  = default_data()
+    start = 1767225600      # 2026-01-01
+    trip["trip"] = {"name": f"{rng.choice(_PLACES)} + {rng.choice(_PLACES)}", "dates": f"{days} days"}
+    for d in range(days):
+        date = time.strftime("%Y-%m-%d", time.gmtime(start + d * 86400))
+        trip["days"].append({
+            "id": f"d{d}", "emoji": "🚗", "label": date, "title": f"{rng.choice(_PLACES)} to {rng.choice(_PLACES)}",
+            "date": date, "description": _text(rng, 14),
+            "stops": [{"time": f"{8 + s % 14:02d}:00", "name": rng.choice(_PLACES), "note": _text(rng, 18),
+                       "mapsUrl": ""} for s in range(stops)]})
+    trip["wxLocations"] = [{"name": p, "tag": p[:3], "lat": round(rng.uniform(36, 43), 4),
+                            "lon": round(rng.uniform(-9, 3), 4), "wind": False, "snow": False}
+                           for p in rng.sample(_PLACES, min(4, len(_PLACES)))]
+    trip["refCats"] = [{"id": "trail", "label": "Trail Status", "icon": "🥾"},
+                       {"id": "booking", "label": "Bookings", "icon": "🎫"}]
+    trip["refs"] = [{"id": f"r{i}", "name": _text(rng, 4), "url": f"https://example.com/{i}",
+                     "cat": rng.choice(("trail", "booking")), "type": "link", "notes": _text(rng, 8)}
+                    for i in range(refs)]
+    trip["groupChecklist"] = [{"id": g, "label": g.title(), "icon": "🎒", "items": [_text(rng, 3) for _ in range(9)]}
+                              for g in ("hiking", "snow", "admin")]
+    trip["members"] = [{"id": f"m{i}", "name": f"Member {i}", "userId": 1000 + i} for i in range(members)]
+    trip["admins"]  = [1000]
+    ids = [m["id"] for m in trip["members"]]
+    for i in range(expenses):
+        amount = round(rng.uniform(5, 300), 2)
+        among  = rng.sample(ids, rng.randint(1, len(ids)))
+        trip["expenses"].append({
+            "id": f"e{i}", "title": _text(rng, 3), "amount": amount, "currency": rng.choice(("SGD", "EUR", "EUR", "USD")),
+            "paidBy": rng.choice(ids), "splitType": "equal", "date": time.strftime("%Y-%m-%d", time.gmtime(start)),
+            "splits": {m: round(amount / len(among), 2) for m in among}})
+    trip["settlements"] = [{"id": f"s{i}", "fromMember": rng.choice(ids), "toMember": rng.choice(ids),
+                            "amount": round(rng.uniform(5, 100), 2), "currency": "SGD"} for i in range(expenses // 10)]
+    return trip
+
+
+# ── Stub Bot API ──────────────────────────────────────────────────────────────
+
+def make_stub():
+    from fastapi import FastAPI, Request
+    stub = FastAPI()
+
+    @stub.post("/bot{token}/{method}")
+    async def bot_api(method: str, request: Request):
+        json_body = request.headers.get("content-type", "").startswith("application/json")
+        form      = await request.json() if json_body else dict(await request.form())
+        if method == "getMe":
+            return {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}}
+        if method == "sendMessage":
+            return {"ok": True, "result": {"message_id": 1, "date": int(time.time()), "text": form.get("text", ""),
+                                           "chat": {"id": int(form["chat_id"]), "type": "group"}}}
+        return {"ok": True, "result": True}
+
+    return stub
+
+
+# ── Load ──────────────────────────────────────────────────────────────────────
+
+def make_requests(route: str, n: int, chats: list, trips: dict, args, rng: random.Random) -> list:
+    """(method, url, body bytes or None, headers) for n requests of route, built before timing."""
+    out = []
+    for i in range(n):
+        chat = rng.choice(chats)
+        if route == "get_data":
+            out.append(("GET", f"/api/data?chat_id={chat}", None, {}))
+        elif route == "post_data":
+            body = dict(trips[chat], trip={**trips[chat]["trip"], "name": f"Bench {i}"})
+            out.append(("POST", f"/api/data?chat_id={chat}&user_id=1000", json.dumps(body).encode(),
+                        {"If-Match": "*", "Content-Type": "application/json"}))
+        elif route == "patch_data":
+            op = [{"op": "add", "path": "/expenses/-", "value": {
+                "id": f"b{i}", "title": "Bench", "amount": 10, "currency": "SGD", "paidBy": "m0",
+                "splitType": "equal", "splits": {"m0": 5, "m1": 5}}}]
+            out.append(("POST", f"/api/data/patch?chat_id={chat}&user_id=1000", json.dumps(op).encode(),
+                        {"If-Match": "*", "Content-Type": "application/json"}))
+        elif route == "is_admin":
+            out.append(("GET", f"/api/is_admin?chat_id={chat}&user_id={1000 + i % args.members}", None, {}))
+        elif route == "upload":
+            out.append(("POST", f"/api/upload?chat_id={chat}&name=bench{i}.bin",
+                        rng.randbytes(args.upload_kb * 1024), {"Content-Type": "application/octet-stream"}))
+        elif route == "webhook":
+            update = {"update_id": 700000 + i, "message": {
+                "message_id": i + 1, "date": int(time.time()),
+                "chat": {"id": int(chat), "type": "group", "title": "Bench"},
+                "from": {"id": 1000 + i % args.members, "is_bot": False, "first_name": "Member"},
+                "text": "/myid", "entities": [{"type": "bot_command", "offset": 0, "length": 5}]}}
+            out.append(("POST", "/webhook", json.dumps(update).encode(),
+                        {"X-Telegram-Bot-Api-Secret-Token": SECRET, "Content-Type": "application/json"}))
+    return out
+
+
+async def drive(client, requests: list, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for method, url, body, headers in pending:
+            start = time.perf_counter()
+            r     = await client.request(method, url, content=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if r.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"requests": len(requests), "errors": errors, "seconds": round(elapsed, 3),
+            "rps": round(len(requests) / elapsed, 1),
+            **{k: round(pct(latencies, p), 2) for k, p in (("p50_ms", .5), ("p95_ms", .95), ("p99_ms", .99))},
+            "max_ms": round(max(latencies) * 1000, 2)}
+
+
+async def run(args) -> dict:
+    import httpx, uvicorn
+    port = free_port()
+    os.environ.update({"BOT_TOKEN": "123:bench", "WEB_APP_URL": "https://bench.invalid",
+                       "BOT_API_URL": f"http://127.0.0.1:{port}/bot", "WEBHOOK_SECRET": SECRET})
+    server  = uvicorn.Server(uvicorn.Config(make_stub(), host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    import main
+    logging.getLogger("httpx").setLevel(logging.WARNING)     # one line per stub Bot API call otherwise
+    rng   = random.Random(args.seed)
+    chats = [str(-1000000000000 - i) for i in range(args.chats)]
+    trips = {}
+    for chat in chats:
+        trips[chat] = make_trip(rng, args.days, args.stops, args.expenses, args.refs, args.members)
+        main.data_file(chat).write_text(json.dumps(trips[chat], ensure_ascii=False))
+    doc_kb = sum(main.data_file(c).stat().st_size for c in chats) / len(chats) / 1024
+
+    results = {}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://tripbot", timeout=60) as client:
+            for chat in chats:
+                await client.get(f"/api/data?chat_id={chat}")
+            for route in args.routes:
+                requests = make_requests(route, args.requests, chats, trips, args, rng)
+                results[route] = await drive(client, requests, args.concurrency)
+                if route == "webhook":
+                    while main.update_queue.pending:
+                        await asyncio.sleep(0.01)
+                print(f"  {route:<11} {results[route]['rps']:>8.0f} req/s")
+        results["_store"] = main.trip_store.stats()
+
+    server.should_exit = True
+    await serving
+    return {"doc_kb": round(doc_kb, 1), "routes": {r: results[r] for r in args.routes}, "store": results["_store"]}
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def report(routes: dict, baseline: dict = None):
+    cols = ("rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print(f"\n{'route':<11} {'reqs':>6} {'errors':>6} " + " ".join(f"{c:>9}" for c in cols))
+    for route, r in routes.items():
+        print(f"{route:<11} {r['requests']:>6} {r['errors']:>6} " + " ".join(f"{r[c]:>9.1f}" for c in cols))
+        old = (baseline or {}).get(route)
+        if old:
+            print(f"{'':<11} {'':>6} {'':>6} " + " ".join(
+                f"{(r[c] - old[c]) / old[c] * 100 if old[c] else 0:>+8.0f}%" for c in cols))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP API and webhook in-process.")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--stops", type=int, default=5, help="stops per day")
+    parser.add_argument("--expenses", type=int, default=200)
+    parser.add_argument("--refs", type=int, default=30)
+    parser.add_argument("--upload-kb", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="per route")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+    args.routes = [r for r in args.routes.split(",") if r]
+    if unknown := set(args.routes) - set(ROUTES):
+        sys.exit(f"❌  unknown route(s): {', '.join(sorted(unknown))} (known: {', '.join(ROUTES)})")
+    out      = Path(args.out).resolve()
+    baseline = json.loads(Path(args.compare).read_text())["routes"] if args.compare else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)                       # trips and uploads for the fake chats go here
+        os.symlink(REPO / "static", "static")
+        sys.path.insert(0, str(REPO))
+        print(f"{args.chats} chats × {args.days} days, {args.expenses} expenses, {args.refs} refs — "
+              f"{args.requests} requests per route, {args.concurrency} concurrent")
+        result = asyncio.run(run(args))
+
+    report(result["routes"], baseline)
+    settings = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    out.write_text(json.dumps({"commit": git_rev(), "python": platform.python_version(), "cpus": os.cpu_count(),
+                               "settings": settings, **result}, indent=2, sort_keys=True) + "\n")
+    print(f"\ntrip size {result['doc_kb']} KB, store {result['store']}\nresults → {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the preview pipeline (previews.py).
+
+Generates a batch of phone-sized JPEG photos in a temp directory, queues them
+all on a PreviewPipeline and times how long the batch takes to render, once
+per worker count. Needs Pillow.
+
+Run: python3 bench_previews.py [images] [worker counts, e.g. 1,2,4]
+"""
+import asyncio, hashlib, io, os, shutil, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+from previews import PreviewPipeline
+
+IMAGES  = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+WORKERS = [int(w) for w in (sys.argv[2] if len(sys.argv) > 2 else f"1,2,{os.cpu_count()}").split(",")]
+
+
+def make_photo(i: int) -> bytes:
+    """A 4032x3024 JPEG with enough detail to compress like a real photo."""
+    img = Image.effect_mandelbrot((4032, 3024), (-2.0 + i * 0.01, -1.2, 1.0, 1.2), 64 + i)
+    img = Image.merge("RGB", (img, img.rotate(180), img.transpose(Image.FLIP_LEFT_RIGHT)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def make_batch(root: Path, n: int) -> list:
+    out = []
+    for i in range(n):
+        data   = make_photo(i)
+        digest = hashlib.sha256(data).hexdigest()
+        path   = root / "blobs" / digest[:2] / f"{digest}.jpg"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        out.append(path)
+    return out
+
+
+async def run_batch(root: Path, batch: list, workers: int) -> float:
+    shutil.rmtree(root / "variants", ignore_errors=True)
+    io_pool = ThreadPoolExecutor(4)
+    loop    = asyncio.get_running_loop()
+    run     = lambda fn, *a: loop.run_in_executor(io_pool, fn, *a)
+    pipe    = PreviewPipeline(root, run, workers=workers, queue_max=len(batch))
+    pipe.start()
+    # Warm the worker processes up so spawn time is not counted
+    await asyncio.gather(*[loop.run_in_executor(pipe._pool, abs, 0) for _ in range(workers)])
+    start = time.perf_counter()
+    for path in batch:
+        pipe.submit(path)
+    await pipe.join()
+    elapsed = time.perf_counter() - start
+    await pipe.stop()
+    if pipe.failed:
+        print(f"  {pipe.failed} renders failed")
+    return elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"generating {IMAGES} photos …")
+        batch = make_batch(root, IMAGES)
+        mb    = sum(p.stat().st_size for p in batch) / 1e6
+        print(f"{IMAGES} photos, {mb:.1f} MB, {os.cpu_count()} CPUs\n")
+        print(f"{'workers':>8} {'seconds':>9} {'images/s':>9}")
+        for workers in WORKERS:
+            elapsed = asyncio.run(run_batch(root, batch, workers))
+            print(f"{workers:>8} {elapsed:>9.2f} {IMAGES / elapsed:>9.1f}")
+        out = sum(f.stat().st_size for f in (root / "variants").rglob("*.jpg")) / 1e6
+        print(f"\nvariants written: {out:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Compressed and pre-encoded API responses.
+
+CompressionMiddleware gzips (or brotli-compresses, when the optional brotli
+package is installed) /api/* responses of at least `minimum_size` bytes
+when the client's Accept-Encoding allows it. Responses that stream
+(/api/events), are already encoded, or aren't text/JSON pass through
+untouched.
+
+EncodedDocs holds the compact JSON encoding of each trip, and each
+compressed variant of it, for as long as the trip stays at the same
+revision. GET /api/data can then answer every member opening the app
+with bytes it already has, encoding and compressing the trip once per
+change instead of once per request.
+"""
+import gzip, json
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS     = ("br", "gzip") if brotli is not None else ("gzip",)
+_COMPRESSIBLE = (b"application/json", b"text/")
+
+
+def pick_encoding(accept: str, available) -> str:
+    """The best of available ("br" before "gzip") that Accept-Encoding allows, else None."""
+    if not accept or not available:
+        return None
+    allowed = set()
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        allowed.add(name.strip().lower())
+    for enc in ("br", "gzip"):
+        if enc in available and (enc in allowed or "*" in allowed):
+            return enc
+    return None
+
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    """body compressed with encoding: fast enough per request, or best for bytes that are kept."""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, 9 if best else 6, mtime=0)
+
+
+def dumps(data) -> bytes:
+    """Compact JSON, the encoding every trip response uses."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# ── Middleware ────────────────────────────────────────────────────────────────
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, prefix: str = "/api/"):
+        self.app          = app
+        self.minimum_size = minimum_size
+        self.prefix       = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+        accept   = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = pick_encoding(accept, ENCODINGS)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message             # held back until the body shows whether to compress
+                return
+            if start is None:
+                return await send(message)
+            head, start = start, None
+            headers = dict(head["headers"])
+            body    = message.get("body", b"")
+            if (message.get("more_body") or len(body) < self.minimum_size or b"content-encoding" in headers
+                    or not headers.get(b"content-type", b"").startswith(_COMPRESSIBLE)):
+                await send(head)
+                return await send(message)
+            body  = compress(body, encoding)
+            raw   = [(k, v) for k, v in head["headers"] if k not in (b"content-length", b"vary")]
+            vary  = headers.get(b"vary")
+            raw  += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(body)).encode()),
+                     (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding")]
+            await send({**head, "headers": raw})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+# ── Pre-encoded trips ─────────────────────────────────────────────────────────
+
+class _Encoded:
+    __slots__ = ("doc", "rev", "body", "variants")
+
+    def __init__(self, doc: dict, rev: int):
+        self.doc      = doc             # the cached document these bytes were made from
+        self.rev      = rev
+        self.body     = dumps(doc)
+        self.variants = {}              # encoding → compressed body
+
+
+class EncodedDocs:
+    def __init__(self, max_entries: int = 256, min_compress: int = 1024):
+        self.max_entries  = max_entries
+        self.min_compress = min_compress
+        self._entries     = OrderedDict()   # chat key → _Encoded
+        self.hits         = 0
+        self.misses       = 0
+
+    def get(self, key: str, doc: dict, rev: int) -> _Encoded:
+        """Compact JSON of doc, reused while key still maps to this same document at this revision."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.doc is doc and entry.rev == rev:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = self._entries[key] = _Encoded(doc, rev)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def body(self, entry: _Encoded, accept: str) -> tuple:
+        """(bytes, content-encoding or None) of entry for a request's Accept-Encoding."""
+        if len(entry.body) < self.min_compress:
+            return entry.body, None
+        encoding = pick_encoding(accept, ENCODINGS)
+        if encoding is None:
+            return entry.body, None
+        variant = entry.variants.get(encoding)
+        if variant is None:
+            variant = entry.variants[encoding] = compress(entry.body, encoding)
+        return variant, encoding
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for running several uvicorn workers on one data directory
+(TRIP_SHARED, see store.py).
+
+Starts `uvicorn main:app --workers W` in a temporary directory and hammers a
+single chat from P client processes. Requests land on whichever worker the
+kernel hands the connection to, so every worker ends up saving the same
+chat. Meanwhile a reader process keeps parsing the trip file as it is on
+disk to catch torn writes (json backend only).
+
+    --mode append    each client adds N expenses with unique ids through
+                     /api/data/patch; all P × N must be on disk, each once
+    --mode remove    the trip is seeded with P × N expenses and each client
+                     removes its own even-numbered ones by index
+                     (remove /expenses/<i>, If-Match the revision it read,
+                     re-read on 409); exactly the odd-numbered ones must be left
+    --mode replace   as append, while one more client keeps rewriting the
+                     whole expenses section through POST /api/data; every
+                     acknowledged append must survive
+
+After the server has shut down (flushing every worker's cache), the trip is
+read back through the storage backend and checked.
+
+By default appends send If-Match: * so they race each other inside the
+workers; with --strict they send the revision they read and retry on 409.
+
+Run: python3 concurrency_test.py [--workers W] [--clients P] [--writes N] [--strict] [--mode M]
+Env: STORAGE_BACKEND (json | journal | sqlite, default json)
+"""
+import argparse, json, os, re, socket, subprocess, sys, tempfile, time
+import urllib.error, urllib.request
+from multiprocessing import Event, Pool, Process, Value
+from pathlib import Path
+
+REPO            = Path(__file__).resolve().parent
+CHAT            = "-4242"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def data_file(key) -> Path:
+    return Path("data") / f"trip_{re.sub(r'[^a-zA-Z0-9]', '_', key)}.json"
+
+
+def call(url: str, body=None, headers=None) -> tuple:
+    req = urllib.request.Request(url, data=json.dumps(body).encode() if body is not None else None,
+                                 method="POST" if body is not None else "GET",
+                                 headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as r:
+            return r.status, r.headers.get("ETag"), json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), json.loads(e.read() or b"{}")
+
+
+# ── Clients ───────────────────────────────────────────────────────────────────
+
+def expense(n: int, i: int) -> dict:
+    return {"id": f"c{n}-{i}", "desc": f"client {n} #{i}", "amount": 1, "currency": "SGD"}
+
+
+def client(args) -> tuple:
+    """Add `writes` expenses; returns (client, ok, conflicts, errors)."""
+    base, n, writes, strict = args
+    ok, conflicts, errors = 0, 0, 0
+    etag = None
+    for i in range(writes):
+        op = [{"op": "add", "path": "/expenses/-", "value": expense(n, i)}]
+        while True:
+            if strict and etag is None:
+                _, etag, _ = call(f"{base}/api/data?chat_id={CHAT}")
+            status, tag, _ = call(f"{base}/api/data/patch?chat_id={CHAT}&user_id={n}", op,
+                                  {"If-Match": etag if strict else "*"})
+            etag = tag
+            if status == 200:
+                ok += 1
+                break
+            if status == 409:
+                conflicts += 1
+                continue
+            errors += 1
+            break
+    return n, ok, conflicts, errors
+
+
+def remover(args) -> tuple:
+    """Remove this client's even-numbered expenses by index; returns (client, ok, conflicts, errors)."""
+    base, n, writes, _ = args
+    ok, conflicts, errors = 0, 0, 0
+    for i in range(0, writes, 2):
+        while True:
+            _, etag, doc = call(f"{base}/api/data?chat_id={CHAT}")
+            ids = [e.get("id") for e in doc.get("expenses", [])]
+            if f"c{n}-{i}" not in ids:
+                errors += 1
+                break
+            op = [{"op": "remove", "path": f"/expenses/{ids.index(f'c{n}-{i}')}"}]
+            status, _, _ = call(f"{base}/api/data/patch?chat_id={CHAT}&user_id={n}", op, {"If-Match": etag})
+            if status == 200:
+                ok += 1
+                break
+            if status == 409:
+                conflicts += 1
+                continue
+            errors += 1
+            break
+    return n, ok, conflicts, errors
+
+
+def replacer(base: str, stop, rewrites):
+    """Keep rewriting the whole expenses section (POST /api/data) with what was just read."""
+    while not stop.is_set():
+        _, etag, doc = call(f"{base}/api/data?chat_id={CHAT}")
+        for e in doc.get("expenses", [])[:1]:
+            e["touched"] = e.get("touched", 0) + 1
+        if call(f"{base}/api/data?chat_id={CHAT}", doc, {"If-Match": etag})[0] == 200:
+            rewrites.value += 1
+
+
+def reader(path: Path, stop, reads, torn):
+    """Parse the trip file over and over; every read must be a complete document."""
+    while not stop.is_set():
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            continue
+        reads.value += 1
+        try:
+            json.loads(raw)
+        except ValueError:
+            torn.value += 1
+
+
+# ── Run ───────────────────────────────────────────────────────────────────────
+
+def wait_ready(base: str, server):
+    for _ in range(300):
+        if server.poll() is not None:
+            sys.exit(f"❌  uvicorn exited with {server.returncode}")
+        try:
+            if call(f"{base}/api/health")[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    sys.exit("❌  uvicorn did not come up")
+
+
+def read_back() -> dict:
+    sys.path.insert(0, str(REPO))
+    from storage import JsonFileBackend, JournalBackend, SqliteBackend
+    if STORAGE_BACKEND == "sqlite":
+        backend = SqliteBackend(Path("data") / "tripbot.db", lambda k: re.sub(r"[^a-zA-Z0-9]", "_", k))
+    elif STORAGE_BACKEND == "journal":
+        backend = JournalBackend(data_file)
+    else:
+        backend = JsonFileBackend(data_file)
+    return backend.read(CHAT)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer one chat from several processes and workers.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument("--strict", action="store_true", help="If-Match the read revision, retry on 409")
+    parser.add_argument("--mode", choices=("append", "remove", "replace"), default="append")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.symlink(REPO / "static", "static")
+        Path("data").mkdir()
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        env  = {**os.environ, "PYTHONPATH": str(REPO), "BOT_TOKEN": "123:test", "WEB_APP_URL": "",
+                "TRIP_SHARED": "1", "STORAGE_BACKEND": STORAGE_BACKEND, "TRIP_FLUSH_DELAY": "0.05"}
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                   "--port", str(port), "--workers", str(args.workers),
+                                   "--log-level", "warning"], env=env)
+        try:
+            wait_ready(base, server)
+            if args.mode == "remove":
+                status, etag, doc = call(f"{base}/api/data?chat_id={CHAT}")
+                doc["expenses"] = [expense(n, i) for n in range(args.clients) for i in range(args.writes)]
+                if call(f"{base}/api/data?chat_id={CHAT}", doc, {"If-Match": etag})[0] != 200:
+                    sys.exit("❌  could not seed the trip")
+            stop, reads, torn = Event(), Value("i", 0), Value("i", 0)
+            watcher = Process(target=reader, args=(data_file(CHAT), stop, reads, torn))
+            if STORAGE_BACKEND == "json":
+                watcher.start()
+            rewrites = Value("i", 0)
+            rewriter = Process(target=replacer, args=(base, stop, rewrites))
+            if args.mode == "replace":
+                rewriter.start()
+
+            start = time.perf_counter()
+            with Pool(args.clients) as pool:
+                results = pool.map(remover if args.mode == "remove" else client,
+                                   [(base, n, args.writes, args.strict) for n in range(args.clients)])
+            elapsed = time.perf_counter() - start
+            stop.set()
+            if args.mode == "replace":
+                rewriter.join()
+            _, _, health = call(f"{base}/api/health")
+        finally:
+            server.terminate()
+            server.wait(30)
+        stop.set()
+        if STORAGE_BACKEND == "json":
+            watcher.join()
+
+        expenses = read_back().get("expenses", [])
+        ids      = [e.get("id") for e in expenses]
+        kept     = range(1, args.writes, 2) if args.mode == "remove" else range(args.writes)
+        expected = {f"c{n}-{i}" for n in range(args.clients) for i in kept}
+        acked    = sum(r[1] for r in results)
+        to_ack   = args.clients * (len(range(0, args.writes, 2)) if args.mode == "remove" else args.writes)
+
+    print(f"backend {STORAGE_BACKEND}, {args.workers} workers, {args.clients} clients × {args.writes} "
+          f"{args.mode}s{' (strict)' if args.strict else ''} in {elapsed:.2f} s")
+    if args.mode == "replace":
+        print(f"section rewrites: {rewrites.value}")
+    print(f"acknowledged:   {acked}  conflicts retried {sum(r[2] for r in results)}  "
+          f"errors {sum(r[3] for r in results)}")
+    print(f"on disk:        {len(ids)} expenses, {len(set(ids))} unique")
+    if STORAGE_BACKEND == "json":
+        print(f"reader:         {reads.value} reads, {torn.value} torn")
+    print(f"last worker:    {health.get('store')}")
+    missing, extra = expected - set(ids), len(ids) - len(set(ids)) + len(set(ids) - expected)
+    if missing or extra or acked != to_ack or torn.value:
+        sys.exit(f"❌  {len(missing)} lost, {extra} duplicated or unexpected, {torn.value} torn reads")
+    print("✓  no lost, duplicated or torn writes")
+
+
+if __name__ == "__main__":
+    main()
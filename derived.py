@@ -0,0 +1,169 @@
+"""
+State derived from a trip's lists, kept current from the docpatch ops of
+every save — the base of the ledgers (settlement.py), the expense index
+(expenses.py) and the spending summaries (analytics.py).
+
+A SectionView holds one entry per item of some top-level lists ("sections"),
+keyed by the item's id, and updates them instead of recomputing everything:
+
+    add     /<section>/-          → add the new items
+    *       /<section>/<i>/...    → swap item i's entry for a new one
+                                    (unless its id changed: resync the section)
+    replace /<section>/<i>        → the same, if the section's ids are unchanged
+    remove  /<section>/<i>        → drop whichever ids are no longer present
+    other structural changes, items without a unique id, or ops mixing
+    structural and in-item changes → resync the section
+    anything touching a REBUILD_ON key, or unknown changes → rebuild
+
+Subclasses implement _reset, _add and _drop; a ViewBook keeps one view per
+chat that has asked for one.
+"""
+from docpatch import parse_pointer, PatchError
+from store import REV_KEY
+
+
+class SectionView:
+    SECTIONS   = ("expenses",)
+    REBUILD_ON = ()                 # other top-level keys whose change means a full rebuild
+
+    def __init__(self):
+        self.rev    = None
+        self._ids   = {s: set() for s in self.SECTIONS}     # section → keys with an entry
+        self._keyed = {s: True for s in self.SECTIONS}      # False if some items lack a unique id
+
+    # ── To implement ──────────────────────────────────────────────────────────
+
+    def _reset(self, data: dict):
+        """Clear every entry and re-read trip-wide settings, before a rebuild."""
+        raise NotImplementedError
+
+    def _add(self, section: str, key, item: dict):
+        raise NotImplementedError
+
+    def _drop(self, section: str, key):
+        raise NotImplementedError
+
+    def _item_key(self, item):
+        return item.get("id") if isinstance(item, dict) else None
+
+    def _unkeyed(self, pos: int):
+        """Key of the item at pos when the section's ids can't be used."""
+        return pos
+
+    def current(self, data: dict) -> bool:
+        return self.rev == data.get(REV_KEY)
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def rebuild(self, data: dict):
+        self._reset(data)
+        for section in self.SECTIONS:
+            self._fill(data, section)
+        self.rev = data.get(REV_KEY)
+
+    def _fill(self, data: dict, section: str):
+        items = data.get(section) if isinstance(data.get(section), list) else []
+        keys  = [self._item_key(i) for i in items if isinstance(i, dict)]
+        self._keyed[section] = None not in keys and len(set(keys)) == len(keys)
+        self._ids[section]   = set()
+        for pos, item in enumerate(items):
+            if isinstance(item, dict):
+                self._track(section, self._item_key(item) if self._keyed[section] else self._unkeyed(pos), item)
+
+    def _resync(self, data: dict, section: str):
+        for key in list(self._ids[section]):
+            self._untrack(section, key)
+        self._fill(data, section)
+
+    def _track(self, section: str, key, item: dict):
+        self._ids[section].add(key)
+        self._add(section, key, item)
+
+    def _untrack(self, section: str, key):
+        self._ids[section].discard(key)
+        self._drop(section, key)
+
+    def apply(self, data: dict, ops):
+        """Bring the view up to date with data, given the ops that produced it (None = unknown)."""
+        if ops is None:
+            return self.rebuild(data)
+        touched = {s: [] for s in self.SECTIONS}
+        for op in ops:
+            try:
+                tokens = parse_pointer(op.get("path"))
+            except PatchError:
+                return self.rebuild(data)
+            if tokens[0] in self.REBUILD_ON:
+                return self.rebuild(data)
+            if tokens[0] in touched:
+                touched[tokens[0]].append((op.get("op"), tokens[1:]))
+        for section, changes in touched.items():
+            if changes:
+                self._apply_section(data, section, changes)
+        self.rev = data.get(REV_KEY)
+
+    def _apply_section(self, data: dict, section: str, changes: list):
+        items = data.get(section)
+        if not isinstance(items, list) or not self._keyed[section]:
+            return self._resync(data, section)
+        structural = [(op, t) for op, t in changes if len(t) == 1 and op != "replace"]
+        in_item    = [t for op, t in changes if len(t) > 1 or op == "replace"]
+        if any(not t for _, t in changes) or structural and in_item or any(t[1:2] == ["id"] for t in in_item):
+            return self._resync(data, section)
+        known = self._ids[section]
+
+        if structural and all(op == "add" and t[0] == "-" for op, t in structural):
+            for item in items[len(items) - len(structural):]:
+                key = self._item_key(item)
+                if key is None or key in known:
+                    return self._resync(data, section)
+                self._track(section, key, item)
+            return
+        if structural and all(op == "remove" for op, _ in structural):
+            present = {self._item_key(i) for i in items}
+            for key in [k for k in known if k not in present]:
+                self._untrack(section, key)
+            return
+        if structural:
+            return self._resync(data, section)
+
+        if any(len(t) == 1 for t in in_item):
+            # A whole item was replaced: fine only if it kept the id of the one it replaced
+            keys = [self._item_key(i) for i in items]
+            if None in keys or len(set(keys)) != len(keys) or set(keys) != known:
+                return self._resync(data, section)
+        for idx in {t[0] for t in in_item}:
+            if not idx.isdigit() or int(idx) >= len(items) or not isinstance(items[int(idx)], dict):
+                return self._resync(data, section)
+            item = items[int(idx)]
+            key  = self._item_key(item)
+            if key is None or key not in known:
+                return self._resync(data, section)      # a new or re-keyed item at idx
+            self._untrack(section, key)
+            self._track(section, key, item)
+
+
+class ViewBook:
+    """One view per chat that has asked for one, kept current by store updates."""
+
+    def __init__(self, make, rates=None):
+        self.rates  = rates
+        self._make  = make
+        self._views: dict = {}
+
+    def on_change(self, key: str, data: dict, ops):
+        view = self._views.get(key)
+        if view is not None:
+            view.apply(data, ops)
+
+    def get(self, key: str, data: dict):
+        if hasattr(self.rates, "refresh"):
+            self.rates.refresh()
+        view = self._views.get(key)
+        if view is None or not view.current(data):
+            view = self._views[key] = self._make()
+            view.rebuild(data)
+        return view
+
+    def forget(self, key: str):
+        self._views.pop(key, None)
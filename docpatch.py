@@ -0,0 +1,122 @@
+"""
+Path-addressed partial updates for trip documents (a subset of RFC 6902).
+
+    [{"op": "replace", "path": "/groupProgress/hiking_0", "value": true},
+     {"op": "add",     "path": "/expenses/-",             "value": {...}},
+     {"op": "remove",  "path": "/refs/3"}]
+
+Supported ops are add, replace and remove. Paths are JSON Pointers (RFC 6901);
+"-" as the last array token appends. A patch is applied all-or-nothing: if any
+op fails, the ops already applied are undone and the document is unchanged.
+"""
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_pointer(path: str) -> list:
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise PatchError(f"invalid path: {path!r}")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+def _index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"invalid array index: {token!r}")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not allow_end):
+        raise PatchError(f"array index out of range: {i}")
+    return i
+
+
+def _resolve(doc, tokens: list):
+    """Walk to the parent of the last token and return (parent, last_token)."""
+    node = doc
+    for t in tokens[:-1]:
+        if isinstance(node, dict):
+            if t not in node:
+                raise PatchError(f"path not found: /{'/'.join(tokens)}")
+            node = node[t]
+        elif isinstance(node, list):
+            node = node[_index(node, t, allow_end=False)]
+        else:
+            raise PatchError(f"path not found: /{'/'.join(tokens)}")
+    if not isinstance(node, (dict, list)):
+        raise PatchError(f"path not found: /{'/'.join(tokens)}")
+    return node, tokens[-1]
+
+
+def _apply_one(doc, op: dict):
+    """Apply a single op and return a callable that reverts it."""
+    if not isinstance(op, dict):
+        raise PatchError("each op must be an object")
+    kind   = op.get("op")
+    tokens = parse_pointer(op.get("path"))
+    if kind in ("add", "replace") and "value" not in op:
+        raise PatchError(f"{kind} requires a value")
+    parent, key = _resolve(doc, tokens)
+    value = op.get("value")
+
+    if isinstance(parent, dict):
+        existed = key in parent
+        old     = parent.get(key)
+        if kind == "add":
+            parent[key] = value
+        elif kind in ("replace", "remove"):
+            if not existed:
+                raise PatchError(f"path not found: {op['path']}")
+            if kind == "replace":
+                parent[key] = value
+            else:
+                del parent[key]
+        else:
+            raise PatchError(f"unsupported op: {kind!r}")
+        if existed:
+            return lambda: parent.__setitem__(key, old)
+        return lambda: parent.pop(key, None)
+
+    if kind == "add":
+        i = _index(parent, key, allow_end=True)
+        parent.insert(i, value)
+        return lambda: parent.pop(i)
+    if kind in ("replace", "remove"):
+        i   = _index(parent, key, allow_end=False)
+        old = parent[i]
+        if kind == "replace":
+            parent[i] = value
+            return lambda: parent.__setitem__(i, old)
+        del parent[i]
+        return lambda: parent.insert(i, old)
+    raise PatchError(f"unsupported op: {kind!r}")
+
+
+def apply_patch(doc: dict, ops: list):
+    """Apply ops to doc in place, atomically. Raises PatchError on any failure."""
+    if not isinstance(ops, list):
+        raise PatchError("patch must be a list of ops")
+    undo = []
+    try:
+        for op in ops:
+            undo.append(_apply_one(doc, op))
+    except PatchError:
+        for revert in reversed(undo):
+            revert()
+        raise
+
+
+def diff_sections(old: dict, new: dict) -> list:
+    """Top-level ops turning old into new — one per added, replaced or removed key."""
+    ops = [{"op": "remove", "path": "/" + _escape(k)} for k in old if k not in new]
+    for k, v in new.items():
+        if k not in old:
+            ops.append({"op": "add", "path": "/" + _escape(k), "value": v})
+        elif old[k] != v:
+            ops.append({"op": "replace", "path": "/" + _escape(k), "value": v})
+    return ops
+
+
+def _escape(token: str) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
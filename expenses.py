@@ -0,0 +1,157 @@
+"""
+Expense index and paginated queries for the Split tab (/api/expenses).
+
+Each trip that has been queried keeps an ExpenseIndex: its expenses sorted
+by (date, id), plus posting sets from member / payer / category / currency
+to expense ids. Like the ledgers in settlement.py it is updated from the
+docpatch ops of every save instead of being rebuilt (see derived.py).
+
+Queries walk the date order newest first — or, when a posting filter is
+given, only the matching ids — and stop once a page is full. Pages are
+chained by an opaque cursor naming the last (date, id) returned, so they
+stay consistent while expenses are added or removed in between.
+"""
+import base64, json
+from bisect import bisect_left, insort
+from derived import SectionView, ViewBook
+
+FILTERS   = ("member", "payer", "category", "currency")
+MAX_LIMIT = 200
+
+
+class BadCursor(ValueError):
+    pass
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key), ensure_ascii=False).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        date, eid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(date), str(eid)
+    except (ValueError, TypeError):
+        raise BadCursor(f"invalid cursor {cursor!r}")
+
+
+def _postings(item: dict) -> list:
+    """(filter, value) pairs an expense is found under."""
+    payments = item.get("payments") if isinstance(item.get("payments"), dict) else {}
+    payers   = set(payments) or {item.get("paidBy")}
+    members  = payers | set(item.get("splits") or {}) | set(item.get("participants") or [])
+    out  = [("payer", p) for p in payers if p is not None]
+    out += [("member", m) for m in members if m is not None]
+    for field in ("category", "currency"):
+        if item.get(field) is not None:
+            out.append((field, item[field]))
+    return out
+
+
+def _text(item: dict) -> str:
+    return " ".join(str(item.get(f) or "") for f in ("title", "note", "category")).lower()
+
+
+class ExpenseIndex(SectionView):
+    def __init__(self):
+        self._clear()
+        super().__init__()
+
+    def _clear(self):
+        self._order = []            # (date, id), ascending
+        self._key   = {}            # id → (date, id)
+        self._item  = {}            # id → expense
+        self._post  = {}            # id → its (filter, value) postings
+        self._by    = {f: {} for f in FILTERS}  # filter → value → set of ids
+        self._text  = {}            # id → lowercase title / note / category
+        self._pos   = None          # id → position in data["expenses"], rebuilt on demand
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def _reset(self, data: dict):
+        self._clear()
+
+    def _item_key(self, item):
+        return str(item["id"]) if isinstance(item, dict) and item.get("id") is not None else None
+
+    def _unkeyed(self, pos: int):
+        return f"#{pos}"
+
+    def _add(self, section: str, eid: str, item: dict):
+        key = (str(item.get("date") or ""), eid)
+        insort(self._order, key)
+        self._key[eid], self._item[eid], self._text[eid] = key, item, _text(item)
+        self._post[eid] = _postings(item)
+        for field, value in self._post[eid]:
+            self._by[field].setdefault(value, set()).add(eid)
+        self._pos = None
+
+    def _drop(self, section: str, eid: str):
+        key = self._key.pop(eid, None)
+        if key is None:
+            return
+        i = bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+        del self._item[eid], self._text[eid]
+        for field, value in self._post.pop(eid):
+            ids = self._by[field].get(value)
+            if ids is not None:
+                ids.discard(eid)
+                if not ids:
+                    del self._by[field][value]
+        self._pos = None
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    def _positions(self, data: dict) -> dict:
+        if self._pos is None:
+            items     = data.get("expenses") or []
+            self._pos = {(str(i.get("id")) if self._keyed["expenses"] else f"#{p}"): p
+                         for p, i in enumerate(items) if isinstance(i, dict)}
+        return self._pos
+
+    def query(self, data: dict, filters: dict = None, date_from: str = None, date_to: str = None,
+              q: str = None, cursor: str = None, limit: int = 50) -> tuple:
+        """
+        One page of expenses, newest date first, as (items, next cursor or None).
+        filters maps member / payer / category / currency to a value; every item
+        gets its current position in data["expenses"] as "index".
+        """
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        after = decode_cursor(cursor) if cursor else None
+        sets  = []
+        for field, value in (filters or {}).items():
+            if value is not None:
+                sets.append(self._by[field].get(value, set()))
+        if sets:
+            sets.sort(key=len)
+            keys = sorted((self._key[e] for e in set.intersection(*sets)), reverse=True)
+        else:
+            hi   = bisect_left(self._order, after) if after else len(self._order)
+            keys = (self._order[i] for i in range(hi - 1, -1, -1))
+        needle = q.lower().strip() if q else ""
+        page   = []
+        for key in keys:
+            date, eid = key
+            if after and key >= after or date_to and date > date_to:
+                continue
+            if date_from and date < date_from:
+                break
+            if needle and needle not in self._text[eid]:
+                continue
+            page.append(key)
+            if len(page) > limit:
+                break
+        more      = len(page) > limit
+        page      = page[:limit]
+        positions = self._positions(data)
+        items     = [{**self._item[eid], "index": positions.get(eid)} for _, eid in page]
+        return items, encode_cursor(page[-1]) if more else None
+
+
+class ExpenseBook(ViewBook):
+    """Expense indexes for the chats that have queried them, kept current by store updates."""
+
+    def __init__(self):
+        super().__init__(ExpenseIndex)
@@ -0,0 +1,124 @@
+"""
+Dated exchange rates for balances and the spending summary (/api/balances,
+/api/debts, /api/summary).
+
+tripCurrency.rates in a trip is one static map, so every conversion uses
+today's idea of the rate whatever day the money was spent. A rate provider
+answers "what was 1 <currency> worth in <base> on <date>" instead; the
+ledgers and summaries use it first and fall back to the trip's static rates
+for any currency it doesn't know.
+
+Providers have one method, rate(currency, base, date) → float or None, and
+a `version` that changes whenever their rates do.
+
+    FX_PROVIDER=static   no dated rates; the trip's own rates only (default)
+    FX_PROVIDER=file     FileRates: a local JSON table, FX_RATES_FILE
+
+The file holds daily reference rates, ECB-style — units of each currency
+per 1 unit of the file's base:
+
+    {"base": "EUR",
+     "rates": {"2024-05-01": {"SGD": 1.4521, "MAD": 10.86, "USD": 1.0712},
+               "2024-05-02": {...}}}
+
+Any pair is crossed through the file's base. The rate for a date is the
+latest one published on or before it (weekends and holidays carry the last
+fixing forward); dates before the table starts use its first rate. The file
+is re-read when its modification time changes, at most every
+`check_every` seconds.
+"""
+import json, logging, os, time
+from bisect import bisect_right
+from pathlib import Path
+
+
+class StaticRates:
+    """No dated rates: every conversion falls back to the trip's tripCurrency.rates."""
+    version = 0
+
+    def rate(self, currency: str, base: str, date: str = None):
+        return None
+
+    def stats(self) -> dict:
+        return {"provider": "static"}
+
+
+class FileRates:
+    def __init__(self, path, check_every: float = 5.0):
+        self.path        = Path(path)
+        self.check_every = check_every
+        self.version     = 0
+        self.base        = None
+        self._series     = {}       # currency → (sorted dates, units per 1 base on each)
+        self._mtime      = None
+        self._checked    = 0.0
+        self.lookups     = 0
+        self.misses      = 0
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        """Re-read the file if it changed since the last read (checked at most every check_every seconds)."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_every:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        self._mtime = mtime
+        try:
+            self._load(json.loads(self.path.read_text()) if mtime is not None else {})
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"FileRates: could not read {self.path}: {e}")
+            return
+        self.version += 1
+
+    def _load(self, table: dict):
+        points = {}
+        for date, day in sorted((table.get("rates") or {}).items()):
+            for currency, units in (day or {}).items():
+                try:
+                    units = float(units)
+                except (TypeError, ValueError):
+                    continue
+                if units > 0:
+                    points.setdefault(currency, ([], []))
+                    points[currency][0].append(date)
+                    points[currency][1].append(units)
+        self.base    = table.get("base")
+        self._series = points
+
+    def _units(self, currency: str, date: str):
+        """Units of currency per 1 of the file's base, as of date."""
+        if currency == self.base:
+            return 1.0
+        series = self._series.get(currency)
+        if series is None:
+            return None
+        dates, values = series
+        i = bisect_right(dates, date) - 1 if date else len(dates) - 1
+        return values[max(i, 0)]
+
+    def rate(self, currency: str, base: str, date: str = None):
+        """Value of 1 currency in base on date, or None if the table lacks either currency."""
+        if currency == base:
+            return 1.0
+        self.lookups += 1
+        cur, out = self._units(currency, date), self._units(base, date)
+        if not cur or out is None:
+            self.misses += 1
+            return None
+        return out / cur
+
+    def stats(self) -> dict:
+        return {"provider": "file", "path": str(self.path), "base": self.base, "currencies": len(self._series),
+                "version": self.version, "lookups": self.lookups, "misses": self.misses}
+
+
+def make_rates(name: str, path=None):
+    if name == "file":
+        return FileRates(path)
+    return StaticRates()
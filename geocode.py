@@ -0,0 +1,163 @@
+"""
+Cached place search for the weather-location form.
+
+/api/geocode answers from three layers, cheapest first:
+
+    1. an in-memory LRU of normalised query → results
+    2. a persistent SQLite cache on disk (survives restarts and deploys)
+    3. the upstream geocoder, only when neither has an answer
+
+Queries are normalised (case-folded, whitespace collapsed) before lookup.
+Prefix reuse: when a shorter prefix of the query is cached with a complete
+result list (fewer results than were asked for, so upstream had nothing
+more), the answer for the longer query is that list filtered by name
+prefix, and nothing goes upstream. Typing "Marrak" after "Marr" is
+therefore free. Open-Meteo matches fuzzily above 3 characters, so this can
+occasionally miss a fuzzy match the upstream would have returned; an empty
+filtered result still goes upstream.
+
+Providers have one coroutine, search(query, count) → list of result dicts
+in Open-Meteo's shape (name, latitude, longitude, country_code, admin1, …).
+OpenMeteoGeocoder is the real API; FixtureGeocoder serves a local JSON list
+of places for offline runs and tests.
+"""
+import asyncio, json, sqlite3, threading, time
+from collections import OrderedDict
+from pathlib import Path
+import httpx
+
+MIN_PREFIX = 3
+
+
+def normalise(query: str) -> str:
+    return " ".join(str(query).casefold().split())
+
+
+class OpenMeteoGeocoder:
+    URL = "https://geocoding-api.open-meteo.com/v1/search"
+
+    def __init__(self, timeout: float = 10.0):
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def search(self, query: str, count: int) -> list:
+        r = await self._client.get(self.URL, params={"name": query, "count": count, "language": "en"})
+        r.raise_for_status()
+        return r.json().get("results") or []
+
+
+class FixtureGeocoder:
+    """Offline provider: name-prefix matches against a JSON list of places."""
+
+    def __init__(self, path=None):
+        self.places = json.loads(Path(path).read_text()) if path else []
+        self.calls  = 0
+
+    async def search(self, query: str, count: int) -> list:
+        self.calls += 1
+        q = normalise(query)
+        return [p for p in self.places if normalise(p.get("name", "")).startswith(q)][:count]
+
+
+class GeocodeCache:
+    def __init__(self, provider, db_path, run, count: int = 10, lru_size: int = 2048):
+        """run(fn, *args) → awaitable running blocking disk access off the loop (IOPool.run)."""
+        self.provider  = provider
+        self.db_path   = Path(db_path)
+        self.count     = count
+        self.lru_size  = lru_size
+        self._run      = run
+        self._lru: "OrderedDict[str, list]" = OrderedDict()
+        self._inflight: dict = {}
+        self._local    = threading.local()
+        self.hits      = {"memory": 0, "disk": 0, "prefix": 0}
+        self.upstream  = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS geocode "
+                         "(query TEXT PRIMARY KEY, results TEXT NOT NULL, fetched REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # ── Disk layer (blocking; called through run) ─────────────────────────────
+
+    def _disk_get(self, queries: list) -> dict:
+        marks = ", ".join("?" * len(queries))
+        rows  = self._conn().execute(f"SELECT query, results FROM geocode WHERE query IN ({marks})",
+                                     queries).fetchall()
+        return {q: json.loads(r) for q, r in rows}
+
+    def _disk_put(self, query: str, results: list):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO geocode (query, results, fetched) VALUES (?, ?, ?)",
+                         (query, json.dumps(results, ensure_ascii=False), time.time()))
+
+    # ── Memory layer ──────────────────────────────────────────────────────────
+
+    def _remember(self, query: str, results: list):
+        self._lru[query] = results
+        self._lru.move_to_end(query)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _from_prefix(self, q: str, cached: dict):
+        """Filtered results of the longest complete cached prefix of q, or None."""
+        for n in range(len(q) - 1, MIN_PREFIX - 1, -1):
+            results = cached.get(q[:n])
+            if results is not None and len(results) < self.count:
+                hits = [r for r in results if normalise(r.get("name", "")).startswith(q)]
+                return hits or None
+        return None
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+
+    async def search(self, query: str, count: int = 1) -> list:
+        q = normalise(query)
+        if len(q) < 2:
+            return []
+        count = max(1, min(count, self.count))
+        if q in self._lru:
+            self.hits["memory"] += 1
+            self._lru.move_to_end(q)
+            return self._lru[q][:count]
+
+        prefixes = [q[:n] for n in range(MIN_PREFIX, len(q))]
+        cached   = {p: self._lru[p] for p in prefixes if p in self._lru}
+        missing  = [p for p in prefixes if p not in cached] + [q]
+        cached.update(await self._run(self._disk_get, missing))
+        if q in cached:
+            self.hits["disk"] += 1
+            self._remember(q, cached[q])
+            return cached[q][:count]
+        hits = self._from_prefix(q, cached)
+        if hits is not None:
+            self.hits["prefix"] += 1
+            self._remember(q, hits)
+            return hits[:count]
+
+        pending = self._inflight.get(q)
+        if pending is None:
+            pending = self._inflight[q] = asyncio.ensure_future(self._fetch(q))
+            pending.add_done_callback(lambda _f: self._inflight.pop(q, None))
+        return (await asyncio.shield(pending))[:count]
+
+    async def _fetch(self, q: str) -> list:
+        self.upstream += 1
+        results = await self.provider.search(q, self.count)
+        self._remember(q, results)
+        await self._run(self._disk_put, q, results)
+        return results
+
+    def stats(self) -> dict:
+        return {"memory": len(self._lru), **{f"{k}_hits": v for k, v in self.hits.items()},
+                "upstream_calls": self.upstream}
+
+
+def make_geocoder(name: str, fixture=None):
+    if name == "fixture":
+        return FixtureGeocoder(fixture)
+    return OpenMeteoGeocoder()
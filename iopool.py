@@ -0,0 +1,54 @@
+"""
+Thread pool for blocking file I/O.
+
+Route handlers and bot commands are coroutines on a single event loop, so any
+open()/read()/write() they do directly stalls every other chat and the
+webhook. Everything that touches the disk goes through IOPool.run() instead,
+which hands the call to a small dedicated thread pool and keeps count of how
+many calls are waiting for a worker.
+"""
+import asyncio, functools, logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+class IOPool:
+    def __init__(self, workers: int = 4, queue_warn: int = 32):
+        self.workers     = workers
+        self.queue_warn  = queue_warn
+        self._executor   = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tripbot-io")
+        self.in_flight   = 0      # submitted and not yet finished (running + queued)
+        self.peak_queued = 0
+        self.completed   = 0
+        self._warned     = False
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a free worker."""
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        queued = self.queued
+        if queued > self.peak_queued:
+            self.peak_queued = queued
+        if queued >= self.queue_warn and not self._warned:
+            self._warned = True
+            logging.warning(f"IOPool: {queued} calls queued behind {self.workers} workers")
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            if self._warned and self.queued < self.queue_warn // 2:
+                self._warned = False
+
+    def stats(self) -> dict:
+        return {
+            "workers":     self.workers,
+            "in_flight":   self.in_flight,
+            "queued":      self.queued,
+            "peak_queued": self.peak_queued,
+            "completed":   self.completed,
+        }
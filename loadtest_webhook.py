@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Load test for the webhook ingestion queue (updates.py).
+
+Replays a burst of Telegram updates against /webhook in-process, with the bot
+talking to a stub Bot API on localhost that answers every call after a
+configurable delay. Every chat sends its updates one after another, as
+Telegram does, while all chats send at once. A share of the updates is
+delivered twice, as Telegram does when a webhook answers late.
+
+Reports webhook response times, how long the queue took to drain, how many
+redeliveries were dropped, and whether each chat's replies came back in
+order.
+
+Updates are synthetic /myid commands unless a JSON-lines file of recorded
+updates is given (one Update object per line).
+
+Run: python3 loadtest_webhook.py [updates] [chats] [recorded.jsonl]
+Env: STUB_LATENCY (seconds per Bot API call, default 0.2), DUPLICATES (share, default 0.1)
+"""
+import asyncio, json, os, random, socket, sys, tempfile, time
+from pathlib import Path
+
+COUNT        = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+CHATS        = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+RECORDED     = sys.argv[3] if len(sys.argv) > 3 else None
+STUB_LATENCY = float(os.environ.get("STUB_LATENCY", 0.2))
+DUPLICATES   = float(os.environ.get("DUPLICATES", 0.1))
+SECRET       = "loadtest"
+REPO         = Path(__file__).resolve().parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_updates(count: int, chats: int) -> list:
+    now = int(time.time())
+    out = []
+    for i in range(count):
+        chat = -100000 - (i % chats)
+        out.append({"update_id": 500000 + i, "message": {
+            "message_id": i + 1, "date": now,
+            "chat": {"id": chat, "type": "group", "title": f"Trip {chat}"},
+            "from": {"id": 1000 + i, "is_bot": False, "first_name": "Member"},
+            "text": "/myid", "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        }})
+    return out
+
+
+# ── Stub Bot API ──────────────────────────────────────────────────────────────
+
+def make_stub(replies: dict):
+    from fastapi import FastAPI, Request
+    stub = FastAPI()
+    seq  = iter(range(1, 1 << 30))
+
+    @stub.post("/bot{token}/{method}")
+    async def bot_api(method: str, request: Request):
+        json_body = request.headers.get("content-type", "").startswith("application/json")
+        form      = await request.json() if json_body else dict(await request.form())
+        await asyncio.sleep(STUB_LATENCY)
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+        elif method == "sendMessage":
+            chat = int(form["chat_id"])
+            replies.setdefault(chat, []).append(form.get("text", ""))
+            result = {"message_id": next(seq), "date": int(time.time()),
+                      "chat": {"id": chat, "type": "group"}, "text": form.get("text", "")}
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    return stub
+
+
+# ── Load ──────────────────────────────────────────────────────────────────────
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+async def run(updates: list):
+    import httpx, uvicorn
+    port = free_port()
+    os.environ.update({"BOT_TOKEN": "123:stub", "WEB_APP_URL": "https://loadtest.invalid",
+                       "BOT_API_URL": f"http://127.0.0.1:{port}/bot", "WEBHOOK_SECRET": SECRET})
+    replies = {}
+    server  = uvicorn.Server(uvicorn.Config(make_stub(replies), host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    import main
+    by_chat = {}
+    for u in updates:
+        chat = (u.get("message") or {}).get("chat", {}).get("id")
+        by_chat.setdefault(chat, []).append(u)
+        if random.random() < DUPLICATES:
+            by_chat[chat].append(u)          # redelivery
+    latencies, statuses = [], {}
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://tripbot") as client:
+            async def send_chat(batch):
+                for u in batch:
+                    start = time.perf_counter()
+                    r = await client.post("/webhook", json=u,
+                                          headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                    latencies.append(time.perf_counter() - start)
+                    statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(send_chat(b) for b in by_chat.values()))
+            sent = time.perf_counter() - start
+            while main.update_queue.pending:
+                await asyncio.sleep(0.01)
+            drained = time.perf_counter() - start
+        stats = main.update_queue.stats()
+
+    server.should_exit = True
+    await serving
+
+    in_order = all(r == sorted(r, key=lambda t: int(t.split("`")[1])) for r in replies.values()
+                   if all(t.count("`") >= 2 for t in r))
+    delivered = sum(len(b) for b in by_chat.values())
+    print(f"updates:        {len(updates)} unique, {delivered} delivered, {len(by_chat)} chats")
+    print(f"stub latency:   {STUB_LATENCY * 1000:.0f} ms per Bot API call")
+    print(f"webhook:        p50 {pct(latencies, .5):.1f} ms  p95 {pct(latencies, .95):.1f} ms  "
+          f"p99 {pct(latencies, .99):.1f} ms  max {max(latencies) * 1000:.1f} ms")
+    print(f"statuses:       {statuses}")
+    print(f"burst sent in:  {sent:.2f} s")
+    print(f"queue drained:  {drained:.2f} s  ({stats['processed'] / drained:.0f} updates/s)")
+    print(f"processed:      {stats['processed']}  failed {stats['failed']}  "
+          f"duplicates dropped {stats['duplicates']}  rejected {stats['rejected']}")
+    print(f"replies:        {sum(len(r) for r in replies.values())}  per-chat order kept: {in_order}")
+
+
+def main():
+    updates = ([json.loads(l) for l in Path(RECORDED).read_text().splitlines() if l.strip()]
+               if RECORDED else synthetic_updates(COUNT, CHATS))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)                       # trip files for the fake chats go here
+        os.symlink(REPO / "static", "static")
+        sys.path.insert(0, str(REPO))
+        asyncio.run(run(updates))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,36 @@ Multi-tenant: each Telegram group/user gets its own trip data file.
   data.json              → fallback for local testing (chatId = 'default')
   data/trip_<id>.json   → per-chat data in production
 """
-import json, os, logging, shutil, uuid, re
+import asyncio, hmac, os, logging, re, sys, time
 from pathlib import Path
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, UploadFile
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MenuButtonWebApp, WebAppInfo
 from telegram.ext import Application, CommandHandler, ContextTypes
+from store import TripStore, revision, REV_KEY
+from iopool import IOPool
+from storage import JsonFileBackend, SqliteBackend, JournalBackend
+from docpatch import apply_patch, diff_sections, PatchError
+from settlement import LedgerBook
+from expenses import ExpenseBook, BadCursor
+from analytics import SummaryBook
+from fxrates import make_rates
+from weather import ForecastCache, make_provider
+from geocode import GeocodeCache, make_geocoder
+from push import PushHub, HubFull
+from uploads import BlobStore, UploadTooLarge, iter_upload
+from previews import PreviewPipeline
+from uploadgc import UploadIndex
+from updates import UpdateQueue
+from schema import default_data, needs_upgrade, upgrade
+from metrics import Registry, MetricsMiddleware, SIZE_BUCKETS
+from profiler import Profiler, ProfileMiddleware
+from assets import AssetBundle, IMMUTABLE
+from compression import CompressionMiddleware, EncodedDocs, dumps
+import merge
 
 logging.basicConfig(level=logging.INFO)
 
@@ -22,12 +43,88 @@ BOT_TOKEN     = os.environ.get("BOT_TOKEN", "")
 _raw_url      = os.environ.get("WEB_APP_URL", "").rstrip("/")
 WEB_APP_URL   = _raw_url if _raw_url.startswith("https://") else f"https://{_raw_url}" if _raw_url else ""
 MINI_APP_LINK = os.environ.get("MINI_APP_LINK", "")
+BOT_API_URL   = os.environ.get("BOT_API_URL", "")     # e.g. a local Bot API server; default api.telegram.org
+
+# Webhook ingestion — see updates.py. Telegram sends WEBHOOK_SECRET back in a header on every call.
+WEBHOOK_SECRET        = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS       = int(os.environ.get("WEBHOOK_WORKERS", 8))          # chats handled in parallel
+WEBHOOK_QUEUE         = int(os.environ.get("WEBHOOK_QUEUE", 1000))         # pending updates before 503
+WEBHOOK_DEDUPE_WINDOW = int(os.environ.get("WEBHOOK_DEDUPE_WINDOW", 10000))  # recent update_ids remembered
+
+# Bearer token for /api/admin/* (seeding scripts); the admin API is off when unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
 
 DATA_DIR    = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 UPLOADS_DIR = DATA_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+# Storage backend: "json" (data/trip_<id>.json), "journal" or "sqlite" — see storage.py
+STORAGE_BACKEND       = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_PATH           = os.environ.get("SQLITE_PATH", str(DATA_DIR / "tripbot.db"))
+JOURNAL_COMPACT_EVERY = int(os.environ.get("JOURNAL_COMPACT_EVERY", 200))   # records before a new snapshot
+
+# In-memory trip cache — see store.py
+TRIP_CACHE_MAX       = int(os.environ.get("TRIP_CACHE_MAX", 256))            # chats held in memory
+TRIP_CACHE_MAX_BYTES = int(os.environ.get("TRIP_CACHE_MAX_BYTES", 64 << 20))
+TRIP_CACHE_IDLE      = float(os.environ.get("TRIP_CACHE_IDLE", 900))         # seconds before an idle chat is dropped
+TRIP_FLUSH_DELAY     = float(os.environ.get("TRIP_FLUSH_DELAY", 1.0))        # seconds saves are coalesced for
+# Several uvicorn workers (WEB_CONCURRENCY > 1) share the trip files: lock per chat, reload on change
+TRIP_SHARED          = os.environ.get("TRIP_SHARED", "1" if int(os.environ.get("WEB_CONCURRENCY", 1)) > 1 else "0") == "1"
+TRIP_WATCH_INTERVAL  = float(os.environ.get("TRIP_WATCH_INTERVAL", 1.0))     # seconds between checks of live chats
+
+# Prometheus metrics at /metrics — see metrics.py. When METRICS_TOKEN is set, scrapes must send it as a Bearer token.
+METRICS_TOKEN   = os.environ.get("METRICS_TOKEN", "")
+registry        = Registry()
+HTTP_SECONDS    = registry.histogram("tripbot_http_request_duration_seconds",
+                                     "HTTP request latency by route template", ("route", "method"))
+HTTP_REQUESTS   = registry.counter("tripbot_http_requests_total",
+                                   "HTTP requests by route template and status", ("route", "method", "status"))
+TRIP_SECONDS    = registry.histogram("tripbot_trip_seconds",
+                                     "load_data / save_data time, served from the cache or not", ("op",))
+STORAGE_SECONDS = registry.histogram("tripbot_storage_seconds",
+                                     "Backend reads and write-behind flushes of trip documents", ("op",))
+TRIP_BYTES      = registry.histogram("tripbot_trip_document_bytes",
+                                     "Encoded size of trip documents read or written", ("op",), SIZE_BUCKETS)
+UPLOAD_BYTES    = registry.histogram("tripbot_upload_bytes", "Size of uploaded files", (), SIZE_BUCKETS)
+UPLOAD_SECONDS  = registry.histogram("tripbot_upload_seconds", "Time to receive, hash and store an upload")
+WEBHOOK_SECONDS = registry.histogram("tripbot_webhook_update_seconds",
+                                     "Time to handle one Telegram update, by command", ("command",))
+
+def _observe_storage(op: str, seconds: float, size):
+    STORAGE_SECONDS.observe(seconds, op)
+    if size:
+        TRIP_BYTES.observe(size, op)
+
+# gzip/brotli for /api/* responses at least this big; trip JSON is encoded once per revision — see compression.py
+API_COMPRESS_MIN = int(os.environ.get("API_COMPRESS_MIN", 1024))
+encoded_docs     = EncodedDocs(TRIP_CACHE_MAX, API_COMPRESS_MIN)
+
+# Blocking disk I/O runs on this pool, never on the event loop — see iopool.py
+IO_WORKERS    = int(os.environ.get("IO_WORKERS", 4))
+IO_QUEUE_WARN = int(os.environ.get("IO_QUEUE_WARN", 32))     # log when this many calls wait for a worker
+io_pool       = IOPool(IO_WORKERS, IO_QUEUE_WARN)
+
+# Sampling profiler for slow requests — see profiler.py. Off (no overhead at all) unless PROFILE=1;
+# requests sending ADMIN_TOKEN in X-Profile or ?profile= are always profiled.
+PROFILE             = os.environ.get("PROFILE", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.01))   # share of /api/* and /webhook requests
+PROFILE_INTERVAL    = float(os.environ.get("PROFILE_INTERVAL", 0.005))     # seconds between stack samples
+PROFILE_TOP         = int(os.environ.get("PROFILE_TOP", 20))               # slowest requests kept with their stacks
+profiler = (Profiler(DATA_DIR / "profiles", io_pool.run, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL, PROFILE_TOP,
+                     ADMIN_TOKEN) if PROFILE else None)
+
+# Forecast proxy — see weather.py. WEATHER_PROVIDER=stub serves offline data.
+WEATHER_PROVIDER = os.environ.get("WEATHER_PROVIDER", "open-meteo")
+WEATHER_TTL      = float(os.environ.get("WEATHER_TTL", 1800))      # seconds a forecast is reused
+forecasts        = ForecastCache(make_provider(WEATHER_PROVIDER), WEATHER_TTL)
+
+# Place search for weather locations — see geocode.py. GEOCODER=fixture reads GEOCODE_FIXTURE.
+GEOCODER        = os.environ.get("GEOCODER", "open-meteo")
+GEOCODE_FIXTURE = os.environ.get("GEOCODE_FIXTURE")
+GEOCODE_DB      = os.environ.get("GEOCODE_DB", str(DATA_DIR / "geocode.db"))
+geocoder        = GeocodeCache(make_geocoder(GEOCODER, GEOCODE_FIXTURE), GEOCODE_DB, io_pool.run)
+
 
 # ── Data helpers ──────────────────────────────────────────────────────────────
 
@@ -40,48 +137,119 @@ def data_file(chat_id) -> Path:
         return Path("data.json")          # backward-compat for local dev
     return DATA_DIR / f"trip_{_safe_id(chat_id)}.json"
 
-def load_data(chat_id="default") -> dict:
-    fpath = data_file(chat_id)
-    if fpath.exists():
-        with open(fpath) as f:
-            return json.load(f)
-    d = default_data()
-    save_data(chat_id, d)
+def _make_backend():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteBackend(SQLITE_PATH, _safe_id)
+    if STORAGE_BACKEND == "journal":
+        return JournalBackend(data_file, JOURNAL_COMPACT_EVERY)
+    return JsonFileBackend(data_file)
+
+trip_store = TripStore(_make_backend(), io_pool.run,
+                       max_entries=TRIP_CACHE_MAX, max_bytes=TRIP_CACHE_MAX_BYTES,
+                       idle_ttl=TRIP_CACHE_IDLE, flush_delay=TRIP_FLUSH_DELAY, shared=TRIP_SHARED,
+                       observe=_observe_storage)
+
+# Per-chat expense indexes for the paginated Split list — see expenses.py
+EXPENSE_PAGE = int(os.environ.get("EXPENSE_PAGE", 50))     # default page size of /api/expenses
+expense_index = ExpenseBook()
+trip_store.subscribe(expense_index.on_change)
+trip_store.on_evict(expense_index.forget)
+
+# Dated FX rates for balances and spending totals — see fxrates.py. FX_PROVIDER=file reads
+# daily rates from FX_RATES_FILE; the default uses each trip's own tripCurrency.rates only.
+FX_PROVIDER   = os.environ.get("FX_PROVIDER", "static")
+FX_RATES_FILE = os.environ.get("FX_RATES_FILE", str(DATA_DIR / "fx_rates.json"))
+fx_rates = make_rates(FX_PROVIDER, FX_RATES_FILE)
+
+# Net balances per chat, updated incrementally on every save — see settlement.py
+ledgers = LedgerBook(fx_rates)
+trip_store.subscribe(ledgers.on_change)
+trip_store.on_evict(ledgers.forget)
+
+# Spending totals per member, category and day — see analytics.py
+summaries = SummaryBook(fx_rates)
+trip_store.subscribe(summaries.on_change)
+trip_store.on_evict(summaries.forget)
+
+# Live change notifications to open Mini Apps — see push.py
+PUSH_HEARTBEAT   = float(os.environ.get("PUSH_HEARTBEAT", 25))
+PUSH_MAX_CLIENTS = int(os.environ.get("PUSH_MAX_CLIENTS", 10000))
+push_hub = PushHub(PUSH_HEARTBEAT, PUSH_MAX_CLIENTS)
+trip_store.subscribe(push_hub.on_change)
+
+# Uploaded files, stored once per content hash — see uploads.py
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 20 << 20))
+blobs = BlobStore(UPLOADS_DIR, DATA_DIR / "tmp", io_pool.run, UPLOAD_MAX_BYTES)
+
+# Thumbnails / first-page previews of uploads, rendered in the background — see previews.py
+PREVIEW_WIDTHS  = tuple(int(w) for w in os.environ.get("PREVIEW_WIDTHS", "160,480,1280").split(","))
+PREVIEW_WORKERS = int(os.environ.get("PREVIEW_WORKERS", 2))      # render processes
+PREVIEW_QUEUE   = int(os.environ.get("PREVIEW_QUEUE", 256))      # uploads waiting to be rendered
+previews = PreviewPipeline(UPLOADS_DIR, io_pool.run, PREVIEW_WIDTHS, PREVIEW_WORKERS, PREVIEW_QUEUE)
+
+# Which chats reference which uploads, and deletion of orphans — see uploadgc.py
+UPLOAD_GC_GRACE    = float(os.environ.get("UPLOAD_GC_GRACE", 86400))    # seconds unreferenced before deletion
+UPLOAD_GC_INTERVAL = float(os.environ.get("UPLOAD_GC_INTERVAL", 600))   # seconds between sweeps
+UPLOAD_GC_BATCH    = int(os.environ.get("UPLOAD_GC_BATCH", 100))        # blobs looked at per sweep
+upload_index = UploadIndex(DATA_DIR / "uploads.db", UPLOADS_DIR, io_pool.run, UPLOAD_GC_GRACE,
+                           lock=blobs.lock, extra_files=previews.variant_files)
+trip_store.subscribe(upload_index.on_change)
+trip_store.on_evict(upload_index.forget)
+
+async def load_data(chat_id="default") -> dict:
+    start = time.perf_counter()
+    d = await trip_store.get(chat_id)
+    if d is None:
+        async with trip_store.locked(chat_id):  # shared mode: only the first worker creates it
+            d = await trip_store.get(chat_id) or trip_store.create(chat_id, default_data())
+    elif needs_upgrade(d):
+        upgrade(d)                     # once per trip; see schema.py
+        save_data(chat_id, d)
+    TRIP_SECONDS.observe(time.perf_counter() - start, "load")
     return d
 
-def save_data(chat_id, data: dict):
-    with open(data_file(chat_id), "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def save_data(chat_id, data: dict, ops=None, author=None) -> int:
+    """
+    Update the cached trip and return its new revision; the disk write happens shortly after.
+    Pass the docpatch ops that produced the change when known, so journaling backends can
+    record just those.
+    """
+    start = time.perf_counter()
+    rev   = trip_store.put(chat_id, data, ops, author)
+    TRIP_SECONDS.observe(time.perf_counter() - start, "save")
+    return rev
+
+def _etag(rev: int) -> str:
+    return f'"{rev}"'
+
+def _etag_matches(header: str, rev: int) -> bool:
+    """True if an If-Match / If-None-Match header value names this revision."""
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == _etag(rev) for t in tags)
+
+def _precondition_failed(request: Request, data: dict):
+    """Writes must carry If-Match with the revision they were based on."""
+    rev    = revision(data)
+    header = request.headers.get("if-match")
+    if header is None:
+        return JSONResponse({"error": "If-Match required", "rev": rev}, status_code=428,
+                            headers={"ETag": _etag(rev)})
+    if not _etag_matches(header, rev):
+        return JSONResponse({"error": "conflict", "rev": rev}, status_code=409,
+                            headers={"ETag": _etag(rev)})
+    return None
 
 def is_admin(user_id: int, data: dict) -> bool:
     admins = data.get("admins", [])
     return len(admins) == 0 or user_id in admins
 
-def default_data() -> dict:
-    """Blank template used when a chat opens the app for the first time."""
-    return {
-        "trip":           {"name": "New Trip", "dates": ""},
-        "days":           [],
-        "accoms":         [],
-        "flights":        [],
-        "weather":        [],
-        "refs":           [],
-        "refCats":        [],
-        "groupChecklist": [],
-        "groupProgress":  {},
-        "wxLocations":    [],
-        "admins":         [],
-        "members":        [],
-        "expenses":       [],
-        "settlements":    [],
-        "tripCurrency":   {"base": "SGD", "rates": {"MAD": 0.29, "EUR": 1.45, "USD": 1.35}},
-        "wishlist":       []
-    }
-
 
 # ── Telegram Bot ──────────────────────────────────────────────────────────────
 
-ptb_app = Application.builder().token(BOT_TOKEN).build()
+_builder = Application.builder().token(BOT_TOKEN)
+if BOT_API_URL:
+    _builder = _builder.base_url(BOT_API_URL)
+ptb_app = _builder.build()
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not MINI_APP_LINK and not WEB_APP_URL:
@@ -103,7 +271,7 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_myid(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid     = update.effective_user.id
     chat_id = update.effective_chat.id if update.effective_chat else "default"
-    data    = load_data(chat_id)
+    data    = await load_data(chat_id)
     role    = "admin" if is_admin(uid, data) else "viewer"
     await update.message.reply_text(
         f"Your ID: `{uid}` ({role})\nChat ID: `{chat_id}`",
@@ -112,7 +280,7 @@ async def cmd_myid(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_addadmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id if update.effective_chat else "default"
-    data    = load_data(chat_id)
+    data    = await load_data(chat_id)
     if not is_admin(update.effective_user.id, data):
         await update.message.reply_text("Not an admin.")
         return
@@ -126,7 +294,8 @@ async def cmd_addadmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         new_id = int(context.args[0])
         if new_id not in data["admins"]:
             data["admins"].append(new_id)
-            save_data(chat_id, data)
+            save_data(chat_id, data, [{"op": "add", "path": "/admins/-", "value": new_id}],
+                      author=update.effective_user.id)
         await update.message.reply_text(f"Added admin: `{new_id}`", parse_mode="Markdown")
     except ValueError:
         await update.message.reply_text("Invalid ID.")
@@ -140,15 +309,69 @@ ptb_app.add_handler(CommandHandler("myid",  cmd_myid))
 ptb_app.add_handler(CommandHandler("addadmin", cmd_addadmin))
 ptb_app.add_error_handler(error_handler)
 
+_COMMANDS = {"start", "trip", "myid", "addadmin"}
+
+def _command(update: Update) -> str:
+    """Metrics label for an update: its command, "other" for unknown ones, "none" if not a command."""
+    text = (update.message.text or "") if update.message else ""
+    word = (text.split(maxsplit=1) or [""])[0]
+    name = word[1:].split("@")[0].lower() if word.startswith("/") else ""
+    return name if name in _COMMANDS else ("other" if name else "none")
+
+async def process_update(update: Update):
+    start = time.perf_counter()
+    frame = sys._getframe() if profiler and profiler.wants() else None
+    if frame:
+        chat = update.effective_chat
+        profiler.begin(frame, f"webhook:{_command(update)}", str(chat.id) if chat else "")
+    try:
+        await ptb_app.process_update(update)
+    finally:
+        WEBHOOK_SECONDS.observe(time.perf_counter() - start, _command(update))
+        if frame:
+            profiler.end(frame)
+
+update_queue = UpdateQueue(process_update, WEBHOOK_WORKERS, WEBHOOK_QUEUE, WEBHOOK_DEDUPE_WINDOW)
+
+# Read at scrape time from the stats() the components keep anyway
+registry.collect("tripbot_cache_hits_total", "Cache hits", "counter", ("cache",), lambda: {
+    ("trips",): trip_store.hits, ("weather",): forecasts.hits,
+    ("geocode",): sum(geocoder.hits.values())})
+registry.collect("tripbot_cache_misses_total", "Cache misses", "counter", ("cache",), lambda: {
+    ("trips",): trip_store.misses, ("weather",): forecasts.misses, ("geocode",): geocoder.upstream})
+registry.collect("tripbot_trip_cache_bytes", "Size of the trips held in memory", "gauge", (),
+                 lambda: trip_store.stats()["bytes"])
+registry.collect("tripbot_trip_cache_dirty", "Cached trips waiting to be written", "gauge", (),
+                 trip_store.dirty_count)
+registry.collect("tripbot_io_queued", "Disk I/O calls waiting for a pool thread", "gauge", (),
+                 lambda: io_pool.queued)
+registry.collect("tripbot_webhook_pending", "Telegram updates queued or being handled", "gauge", (),
+                 lambda: update_queue.pending)
+registry.collect("tripbot_sse_clients", "Open /api/events streams", "gauge", (), lambda: push_hub.clients)
+
 
 # ── FastAPI App ───────────────────────────────────────────────────────────────
 
+async def watch_shared_chats():
+    """Shared mode: pick up other workers' saves to chats that have live streams open here."""
+    while True:
+        await asyncio.sleep(TRIP_WATCH_INTERVAL)
+        for key in push_hub.chats():
+            try:
+                data = await trip_store.get(key)
+            except Exception:
+                logging.exception(f"watch_shared_chats: reloading chat {key} failed")
+                continue
+            if data is not None and push_hub.behind(key, revision(data)):
+                push_hub.on_change(key, data, None)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     if BOT_TOKEN and WEB_APP_URL:
-        await ptb_app.bot.set_webhook(f"{WEB_APP_URL}/webhook")
+        await ptb_app.bot.set_webhook(f"{WEB_APP_URL}/webhook", secret_token=WEBHOOK_SECRET or None)
         await ptb_app.initialize()
         await ptb_app.start()
+        update_queue.start()
         try:
             await ptb_app.bot.set_chat_menu_button(
                 menu_button=MenuButtonWebApp(
@@ -158,44 +381,208 @@ async def lifespan(app: FastAPI):
             )
         except Exception as e:
             logging.warning(f"Could not set menu button: {e}")
-    yield
-    if BOT_TOKEN and WEB_APP_URL:
-        await ptb_app.stop()
-        await ptb_app.shutdown()
+    previews.start()
+    sweeper = asyncio.create_task(upload_index.sweep_forever(UPLOAD_GC_INTERVAL, UPLOAD_GC_BATCH))
+    watcher = asyncio.create_task(watch_shared_chats()) if TRIP_SHARED else None
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        if watcher:
+            watcher.cancel()
+        await previews.stop()
+        try:
+            if BOT_TOKEN and WEB_APP_URL:
+                await update_queue.stop()
+                await ptb_app.stop()
+                await ptb_app.shutdown()
+        finally:
+            await trip_store.flush()    # never lose write-behind saves on shutdown
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CompressionMiddleware, minimum_size=API_COMPRESS_MIN)
+app.add_middleware(MetricsMiddleware, latency=HTTP_SECONDS, requests=HTTP_REQUESTS)
+if profiler:
+    app.add_middleware(ProfileMiddleware, profiler=profiler)
 
 
 # ── Routes ────────────────────────────────────────────────────────────────────
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
+    if WEBHOOK_SECRET and not hmac.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), WEBHOOK_SECRET):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
     body   = await request.json()
     update = Update.de_json(body, ptb_app.bot)
-    await ptb_app.process_update(update)
+    chat   = update.effective_chat or update.effective_user
+    # Handled in the background — answering late makes Telegram deliver the update again
+    if update_queue.offer(update.update_id, chat.id if chat else update.update_id, update) == "full":
+        return JSONResponse({"error": "busy"}, status_code=503, headers={"Retry-After": "1"})
     return {"ok": True}
 
+@app.get("/api/health")
+async def api_health():
+    return {"ok": True, "store": trip_store.stats(), "io": io_pool.stats(), "weather": forecasts.stats(),
+            "geocode": geocoder.stats(), "push": push_hub.stats(), "uploads": blobs.stats(),
+            "previews": previews.stats(), "upload_gc": upload_index.stats(),
+            "webhook": update_queue.stats(), "assets": assets.stats(), "encoded": encoded_docs.stats(),
+            "fx": fx_rates.stats()}
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def api_metrics(request: Request):
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("authorization", "").encode(),
+                                                 f"Bearer {METRICS_TOKEN}".encode()):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+# The Mini App: a small HTML shell plus hashed, precompressed JS/CSS held in memory — see assets.py
+assets = AssetBundle("static/index.html")
+
 @app.get("/")
-async def serve_app():
-    return FileResponse("static/index.html")
+async def serve_app(request: Request):
+    return assets.shell.response(request.headers, "no-cache")
+
+@app.get("/assets/{name}")
+async def serve_asset(name: str, request: Request):
+    asset = assets.get(name)
+    if asset is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return asset.response(request.headers, IMMUTABLE)
 
 # Trip data — all endpoints accept chat_id query param
 @app.get("/api/data")
-async def api_get_data(chat_id: str = "default"):
-    return load_data(chat_id)
+async def api_get_data(request: Request, chat_id: str = "default"):
+    data    = await load_data(chat_id)
+    headers = {"ETag": _etag(revision(data)), "Cache-Control": "no-cache"}
+    inm     = request.headers.get("if-none-match")
+    if inm and _etag_matches(inm, revision(data)):
+        return Response(status_code=304, headers=headers)
+    body, encoding = encoded_docs.body(encoded_docs.get(str(chat_id), data, revision(data)),
+                                       request.headers.get("accept-encoding", ""))
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+# Everything the Mini App needs to open, in one round trip: the (upgraded) trip and the caller's role
+@app.get("/api/bootstrap")
+async def api_bootstrap(chat_id: str = "default", user_id: int | None = None):
+    data  = await load_data(chat_id)
+    admin = user_id is not None and is_admin(user_id, data)
+    rest  = dumps({"rev": revision(data), "is_admin": admin, "role": "admin" if admin else "viewer"})
+    body  = b'{"data":' + encoded_docs.get(str(chat_id), data, revision(data)).body + b"," + rest[1:]
+    return Response(body, media_type="application/json",
+                    headers={"ETag": _etag(revision(data)), "Cache-Control": "no-cache"})
 
 @app.post("/api/data")
-async def api_save_data(request: Request, chat_id: str = "default"):
+async def api_save_data(request: Request, chat_id: str = "default", user_id: int | None = None):
     body = await request.json()
     if "trip" not in body or "days" not in body:
         return JSONResponse({"error": "invalid"}, status_code=400)
-    save_data(chat_id, body)
-    return {"ok": True}
+    async with trip_store.locked(chat_id):     # shared mode: If-Match is checked against the disk
+        data = await load_data(chat_id)
+        if failed := _precondition_failed(request, data):
+            return failed
+        ops = [op for op in diff_sections(data, body) if op["path"] != "/" + REV_KEY]
+        rev = save_data(chat_id, body, ops, author=user_id)
+    return JSONResponse({"ok": True, "rev": rev}, headers={"ETag": _etag(rev)})
+
+# Partial update — body is a list of add/replace/remove ops (see docpatch.py)
+@app.post("/api/data/patch")
+async def api_patch_data(request: Request, chat_id: str = "default", user_id: int | None = None):
+    ops = await request.json()
+    if isinstance(ops, list) and any(
+            isinstance(op, dict) and op.get("op") == "remove" and op.get("path") in ("/trip", "/days")
+            for op in ops):
+        return JSONResponse({"error": "invalid"}, status_code=400)
+    if isinstance(ops, list) and any(
+            isinstance(op, dict) and str(op.get("path")).split("/")[1:2] == [REV_KEY] for op in ops):
+        return JSONResponse({"error": f"/{REV_KEY} is set by the server"}, status_code=400)
+    async with trip_store.locked(chat_id):
+        data = await load_data(chat_id)
+        if failed := _precondition_failed(request, data):
+            return failed
+        try:
+            apply_patch(data, ops)
+        except PatchError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        rev = save_data(chat_id, data, ops, author=user_id)
+    return JSONResponse({"ok": True, "rev": rev}, headers={"ETag": _etag(rev)})
+
+# Server-Sent Events stream of {"rev", "sections"} notifications for one chat
+@app.get("/api/events")
+async def api_events(request: Request, chat_id: str = "default"):
+    data = await load_data(chat_id)
+    try:
+        sub = push_hub.subscribe(str(chat_id), revision(data))
+    except HubFull:
+        return JSONResponse({"error": "too many connections"}, status_code=503)
+    return StreamingResponse(push_hub.stream(str(chat_id), sub, request.is_disconnected),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Balances and simplified debts in the trip's base currency
+@app.get("/api/balances")
+async def api_balances(chat_id: str = "default"):
+    data   = await load_data(chat_id)
+    ledger = ledgers.get(str(chat_id), data)
+    return {"rev": revision(data), "base": ledger.base, "net": ledger.balances(data.get("members") or [])}
+
+@app.get("/api/debts")
+async def api_debts(chat_id: str = "default"):
+    data    = await load_data(chat_id)
+    ledger  = ledgers.get(str(chat_id), data)
+    members = data.get("members") or []
+    return {"rev": revision(data), "base": ledger.base,
+            "debts": ledger.debts(members), "net": ledger.balances(members)}
+
+# Spending totals in the base currency: per member (paid / share), per category, per day and per currency
+@app.get("/api/summary")
+async def api_summary(chat_id: str = "default"):
+    data = await load_data(chat_id)
+    return {"rev": revision(data), **summaries.get(str(chat_id), data).summary(data.get("members") or [])}
+
+# One page of expenses, newest first, filtered server-side; pass next_cursor back for the next page
+@app.get("/api/expenses")
+async def api_expenses(request: Request, chat_id: str = "default", member: str = None, payer: str = None,
+                       category: str = None, currency: str = None, q: str = None,
+                       cursor: str = None, limit: int = EXPENSE_PAGE):
+    data    = await load_data(chat_id)
+    index   = expense_index.get(str(chat_id), data)
+    params  = request.query_params
+    filters = {"member": member, "payer": payer, "category": category, "currency": currency}
+    try:
+        items, next_cursor = index.query(data, filters, params.get("from"), params.get("to"), q, cursor, limit)
+    except BadCursor as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {"rev": revision(data), "items": items, "next_cursor": next_cursor}
+
+# Live forecasts for all of a trip's wxLocations, in the same order
+@app.get("/api/weather")
+async def api_weather(chat_id: str = "default"):
+    data = await load_data(chat_id)
+    try:
+        locations = await forecasts.for_locations(data.get("wxLocations") or [])
+    except Exception as e:
+        logging.warning(f"api_weather: upstream failed: {e}")
+        return JSONResponse({"error": "forecast unavailable"}, status_code=502)
+    return {"locations": locations}
+
+@app.get("/api/geocode")
+async def api_geocode(q: str, count: int = 1):
+    try:
+        results = await geocoder.search(q, count)
+    except Exception as e:
+        logging.warning(f"api_geocode: upstream failed: {e}")
+        return JSONResponse({"error": "geocoding unavailable"}, status_code=502)
+    return {"results": results}
 
 @app.get("/api/is_admin")
 async def api_is_admin(user_id: int, chat_id: str = "default"):
-    data = load_data(chat_id)
+    data = await load_data(chat_id)
     return {"is_admin": is_admin(user_id, data)}
 
 @app.post("/api/addadmin")
@@ -204,23 +591,96 @@ async def api_add_admin(request: Request):
     requester_id = body.get("requester_id")
     new_id       = body.get("user_id")
     chat_id      = body.get("chat_id", "default")
-    data         = load_data(chat_id)
+    data         = await load_data(chat_id)
     if not is_admin(requester_id, data):
         return JSONResponse({"error": "not admin"}, status_code=403)
     if new_id not in data["admins"]:
         data["admins"].append(new_id)
-        save_data(chat_id, data)
+        save_data(chat_id, data, [{"op": "add", "path": "/admins/-", "value": new_id}],
+                  author=requester_id)
     return {"ok": True}
 
-# File uploads — stored under static/uploads/<chat_id>_<uuid>.<ext>
+# File uploads — stored content-addressed under data/uploads/blobs/, see uploads.py.
+# The body is the raw file (name in ?name=); multipart form uploads are still accepted.
 @app.post("/api/upload")
-async def api_upload(file: UploadFile, chat_id: str = "default"):
-    ext   = Path(file.filename or "file").suffix.lower()
-    fname = f"{_safe_id(chat_id)}_{uuid.uuid4().hex[:10]}{ext}"
-    dest  = UPLOADS_DIR / fname
-    with open(dest, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    return {"url": f"/uploads/{fname}", "originalName": file.filename}
+async def api_upload(request: Request, chat_id: str = "default", name: str = ""):
+    start  = time.perf_counter()
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > UPLOAD_MAX_BYTES + 64 * 1024:
+        return JSONResponse({"error": "file too large", "max_bytes": UPLOAD_MAX_BYTES}, status_code=413)
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            file = form.get("file")
+            if file is None or isinstance(file, str):
+                return JSONResponse({"error": "no file"}, status_code=400)
+            name   = file.filename or name
+            stored = await blobs.store(name, iter_upload(file))
+        else:
+            stored = await blobs.store(name, request.stream())
+    except UploadTooLarge:
+        return JSONResponse({"error": "file too large", "max_bytes": UPLOAD_MAX_BYTES}, status_code=413)
+    UPLOAD_SECONDS.observe(time.perf_counter() - start)
+    UPLOAD_BYTES.observe(stored["size"])
+    await upload_index.register(chat_id, stored, name)
+    if not stored["deduplicated"]:
+        previews.submit(stored["path"])
+    return {"url": stored["url"], "originalName": name, "size": stored["size"],
+            "deduplicated": stored["deduplicated"]}
+
+# Downscaled variant of an uploaded image/PDF: the smallest one at least w px wide
+@app.get("/api/preview")
+async def api_preview(url: str, w: int = 480):
+    best = await previews.best(url, w)
+    if best is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    path, is_variant = best
+    # Variants never change; the original is only a stand-in until they exist
+    cache = "public, max-age=31536000, immutable" if is_variant else "public, max-age=60"
+    return FileResponse(path, headers={"Cache-Control": cache})
+
+# ── Admin API ─────────────────────────────────────────────────────────────────
+
+def _admin_denied(request: Request):
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "admin API disabled"}, status_code=403)
+    auth = request.headers.get("authorization", "")
+    if not hmac.compare_digest(auth.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return None
+
+# Merge template items into sections of one or many trips — see merge.py and merge_sections.py
+@app.post("/api/admin/merge")
+async def api_admin_merge(request: Request):
+    if denied := _admin_denied(request):
+        return denied
+    body     = await request.json()
+    chat_ids = body.get("chat_ids") or ([body["chat_id"]] if "chat_id" in body else [])
+    sections = body.get("sections")
+    mode     = body.get("mode", "upsert")
+    reset    = body.get("reset") or []
+    if not chat_ids or not all(isinstance(c, (str, int)) for c in chat_ids):
+        return JSONResponse({"error": "chat_ids required"}, status_code=400)
+    if error := merge.validate(sections, mode, reset):
+        return JSONResponse({"error": error}, status_code=400)
+    results = []
+    for chat_id in dict.fromkeys(str(c) for c in chat_ids):
+        async with trip_store.locked(chat_id):
+            data = await load_data(chat_id)
+            # No await between this load, the merge and the save: nothing can change the chat in between
+            ops, counts = merge.merge(data, sections, mode, reset, default_data())
+            rev = save_data(chat_id, data, ops, author="admin") if ops else revision(data)
+        results.append({"chat_id": chat_id, "rev": rev, **counts})
+    return {"ok": True, "results": results}
+
+# Slowest profiled requests with their collapsed stacks (PROFILE=1); aggregates are in data/profiles/*.folded
+@app.get("/api/admin/profiles")
+async def api_admin_profiles(request: Request):
+    if denied := _admin_denied(request):
+        return denied
+    if profiler is None:
+        return JSONResponse({"error": "profiling is off (set PROFILE=1)"}, status_code=404)
+    return {"stats": profiler.stats(), "slowest": profiler.slowest()}
 
 # Serve static assets and uploaded files
 app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR), name="uploads")
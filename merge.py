@@ -0,0 +1,92 @@
+"""
+Server-side merging of template items into trip sections.
+
+Used by POST /api/admin/merge (and merge_sections.py) to seed Info Board
+refs, weather locations and checklists into one or many trips without the
+client round trip of downloading a whole trip and posting it back.
+
+Items are matched to existing ones by a key field per section:
+
+    refs, refCats, groupChecklist   id
+    wxLocations                     name   (locations have no id)
+
+and merged in one of three modes:
+
+    upsert   replace matching items in place, append the rest     (default)
+    insert   only append items whose key isn't there yet
+    replace  the section becomes exactly the given items
+
+merge() returns the docpatch ops for what actually changed (values copied,
+never shared with the document), so the save is journaled as a small change
+and push/ledger listeners see precise sections.
+"""
+import copy
+
+MERGE_KEYS = {"refs": "id", "refCats": "id", "groupChecklist": "id", "wxLocations": "name"}
+RESETTABLE = {"groupProgress"}      # sections a merge may clear back to their default
+MODES      = ("upsert", "insert", "replace")
+
+
+def validate(sections, mode: str, reset) -> str:
+    """An error message for a malformed merge request, or None."""
+    if mode not in MODES:
+        return f"mode must be one of {', '.join(MODES)}"
+    if not isinstance(sections, dict) or not sections:
+        return "sections must be an object of section → items"
+    for name, items in sections.items():
+        key = MERGE_KEYS.get(name)
+        if key is None:
+            return f"section {name!r} can't be merged (allowed: {', '.join(MERGE_KEYS)})"
+        if not isinstance(items, list) or not all(isinstance(i, dict) and key in i for i in items):
+            return f"{name} items must be objects with a {key!r}"
+        keys = [i[key] for i in items]
+        if len(set(map(str, keys))) != len(keys):
+            return f"{name} items have duplicate {key!r} values"
+    for name in reset or []:
+        if name not in RESETTABLE:
+            return f"section {name!r} can't be reset (allowed: {', '.join(RESETTABLE)})"
+    return None
+
+
+def merge(data: dict, sections: dict, mode: str = "upsert", reset=(), defaults=None) -> tuple:
+    """
+    Merge validated sections into data in place.
+    Returns (ops, counts) with counts {"added", "updated", "unchanged"}.
+    """
+    ops    = []
+    counts = {"added": 0, "updated": 0, "unchanged": 0}
+    for name, items in sections.items():
+        key     = MERGE_KEYS[name]
+        current = data.get(name)
+        if not isinstance(current, list):
+            current = None
+        if mode == "replace" or current is None:
+            if items != current:
+                ops.append({"op": "replace" if name in data else "add", "path": f"/{name}",
+                            "value": copy.deepcopy(items)})
+                data[name] = copy.deepcopy(items)
+                counts["added"] += len(items)
+            else:
+                counts["unchanged"] += len(items)
+            continue
+        index = {str(item.get(key)): i for i, item in enumerate(current) if isinstance(item, dict)}
+        for item in items:
+            pos = index.get(str(item[key]))
+            if pos is None:
+                current.append(copy.deepcopy(item))
+                index[str(item[key])] = len(current) - 1
+                ops.append({"op": "add", "path": f"/{name}/-", "value": copy.deepcopy(item)})
+                counts["added"] += 1
+            elif mode == "upsert" and current[pos] != item:
+                current[pos] = copy.deepcopy(item)
+                ops.append({"op": "replace", "path": f"/{name}/{pos}", "value": copy.deepcopy(item)})
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+    for name in reset or ():
+        blank = (defaults or {}).get(name)
+        if data.get(name) != blank:
+            ops.append({"op": "replace" if name in data else "add", "path": f"/{name}",
+                        "value": copy.deepcopy(blank)})
+            data[name] = copy.deepcopy(blank)
+    return ops, counts
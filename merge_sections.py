@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Merge a template of Info Board refs, weather locations or checklists into
+one or many trips, server-side, in one call to /api/admin/merge.
+
+The template is a JSON file:
+
+    {"sections": {"refCats": [...], "refs": [...]},   # refs/refCats/groupChecklist by id,
+                                                      # wxLocations by name
+     "mode":     "upsert",                           # upsert | insert | replace
+     "reset":    ["groupProgress"]}                   # optional
+
+Needs ADMIN_TOKEN (same value as the server's) in the environment.
+
+Run: python3 merge_sections.py template.json CHAT_ID [CHAT_ID ...] [--mode M] [--url URL]
+"""
+import argparse, json, os, sys, urllib.error, urllib.request
+
+BASE_URL = os.environ.get("BASE_URL", "https://tripobot-production.up.railway.app")
+
+
+def merge(chat_ids, sections: dict, mode: str = "upsert", reset=(), base_url: str = BASE_URL) -> list:
+    """POST one merge for all chat_ids; returns the per-chat results."""
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        sys.exit("❌  Set ADMIN_TOKEN first.")
+    body = json.dumps({"chat_ids": list(chat_ids), "sections": sections,
+                       "mode": mode, "reset": list(reset)}).encode()
+    req  = urllib.request.Request(f"{base_url}/api/admin/merge", data=body, method="POST",
+                                  headers={"Content-Type": "application/json",
+                                           "Authorization": f"Bearer {token}"})
+    try:
+        with urllib.request.urlopen(req) as r:
+            return json.loads(r.read())["results"]
+    except urllib.error.HTTPError as e:
+        sys.exit(f"❌  {e.code}: {e.read().decode()}")
+
+
+def report(results: list):
+    for r in results:
+        print(f"  {r['chat_id']}: +{r['added']} added, {r['updated']} updated, "
+              f"{r['unchanged']} unchanged → rev {r['rev']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge template sections into trips.")
+    parser.add_argument("template")
+    parser.add_argument("chat_ids", nargs="+")
+    parser.add_argument("--mode", choices=("upsert", "insert", "replace"))
+    parser.add_argument("--url", default=BASE_URL)
+    args = parser.parse_args()
+
+    with open(args.template) as f:
+        template = json.load(f)
+    mode = args.mode or template.get("mode", "upsert")
+    print(f"Merging {', '.join(template['sections'])} ({mode}) into {len(args.chat_ids)} trip(s)...")
+    report(merge(args.chat_ids, template["sections"], mode, template.get("reset", ()), args.url))
+
+
+if __name__ == "__main__":
+    main()
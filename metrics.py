@@ -0,0 +1,144 @@
+"""
+Prometheus metrics, in the text exposition format, without a client library.
+
+Counters and histograms are plain dicts of label values → numbers, updated
+on the event loop; observing a value is a bisect and two additions, cheap
+enough to leave on for every request. Numbers that other modules already
+keep (cache hits, queue depths) are not duplicated: a collector registered
+with Registry.collect() reads them from their stats() when /metrics is
+scraped.
+
+    REQUESTS = registry.histogram("tripbot_http_request_seconds", "...", ("route", "method"))
+    REQUESTS.observe(0.012, "/api/data", "GET")
+
+MetricsMiddleware times every HTTP request under its route template
+("/api/data", not the URL), so the number of series stays bounded.
+"""
+import time
+from bisect import bisect_left
+
+# Seconds: 1 ms … 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes: 1 KB … 64 MB
+SIZE_BUCKETS    = tuple(1024 * 4 ** i for i in range(9))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(x) -> str:
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: dict = {}         # label values → count
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def lines(self) -> list:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in self._values.items()]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(buckets)
+        self._series: dict = {}         # label values → [count per bucket (+Inf last), sum]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def lines(self) -> list:
+        out = []
+        for labels, (counts, total) in self._series.items():
+            running = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                running += n
+                le = f'le="{_num(bound) if bound != "+Inf" else bound}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {running}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics    = []
+        self._collectors = []
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, name: str, help: str, type: str, labelnames: tuple, fn):
+        """
+        Read a metric at scrape time: fn() → {label values tuple: number}
+        (or a single number when there are no labels).
+        """
+        self._collectors.append((name, help, type, labelnames, fn))
+
+    def render(self) -> str:
+        out = []
+        for m in self._metrics:
+            out += [f"# HELP {m.name} {m.help}", f"# TYPE {m.name} {m.type}", *m.lines()]
+        for name, help, type, labelnames, fn in self._collectors:
+            values = fn()
+            if not isinstance(values, dict):
+                values = {(): values}
+            out += [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+            out += [f"{name}{_labels(labelnames, k)} {_num(v)}" for k, v in values.items()]
+        return "\n".join(out) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request count and latency per route template, method and status."""
+
+    def __init__(self, app, latency: Histogram, requests: Counter):
+        self.app      = app
+        self.latency  = latency       # labels (route, method)
+        self.requests = requests      # labels (route, method, status)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            path  = route.path if route is not None else "unmatched"
+            self.latency.observe(time.perf_counter() - start, path, scope["method"])
+            self.requests.inc(path, scope["method"], status)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Upgrade every stored trip to the current schema version (see schema.py).
+
+Trips are migrated in parallel on a process pool, through the same storage
+backend the bot uses (STORAGE_BACKEND, SQLITE_PATH as in main.py). With
+--dry-run nothing is written; the report shows what each trip would go
+through. Trips already at the current version are not rewritten.
+
+Stop the bot first: it caches trips in memory and would write its copies
+back over the migrated ones. (Trips missed here are still migrated lazily
+the first time the bot loads them.)
+
+Run: python3 migrate_schema.py [--dry-run] [--workers N]
+"""
+import argparse, os, re, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from storage import JsonFileBackend, SqliteBackend, JournalBackend
+from schema import SCHEMA_KEY, SCHEMA_VERSION, upgrade
+from store import REV_KEY, revision
+
+DATA_DIR        = Path("data")
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_PATH     = os.environ.get("SQLITE_PATH", str(DATA_DIR / "tripbot.db"))
+
+
+def data_file(key) -> Path:
+    if key == "default":
+        return Path("data.json")
+    return DATA_DIR / f"trip_{re.sub(r'[^a-zA-Z0-9]', '_', key)}.json"
+
+
+def make_backend():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteBackend(SQLITE_PATH)
+    if STORAGE_BACKEND == "journal":
+        return JournalBackend(data_file)
+    return JsonFileBackend(data_file)
+
+
+def trip_keys() -> list:
+    if STORAGE_BACKEND == "sqlite":
+        conn = make_backend()._conn()
+        return [k for (k,) in conn.execute("SELECT chat_id FROM trips ORDER BY chat_id")]
+    keys = ["default"] if Path("data.json").exists() else []
+    for fpath in sorted(DATA_DIR.glob("trip_*.json")):
+        name = fpath.name[len("trip_"):]
+        keys.append(name[:-len(".snap.json")] if name.endswith(".snap.json") else name[:-len(".json")])
+    return sorted(set(keys), key=keys.index)
+
+
+# ── Worker processes ──────────────────────────────────────────────────────────
+
+_backend = None
+
+
+def _init():
+    global _backend
+    _backend = make_backend()
+
+
+def migrate_one(key: str, dry_run: bool) -> tuple:
+    """(key, old version, steps done, error)"""
+    try:
+        loaded = _backend.read(key)
+        if loaded is None:
+            return key, None, [], "not found"
+        data    = loaded[0]
+        version = data.get(SCHEMA_KEY, 0)
+        done    = upgrade(data)
+        if done and not dry_run:
+            data[REV_KEY] = revision(data) + 1      # a new document: cached ETags must not match it
+            payload, _ = _backend.encode(key, data, None)
+            _backend.write(key, payload)
+        return key, version, done, None
+    except Exception as e:
+        return key, None, [], f"{type(e).__name__}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade stored trips to the current schema version.")
+    parser.add_argument("--dry-run", action="store_true", help="report only, write nothing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    keys  = trip_keys()
+    start = time.perf_counter()
+    print(f"{len(keys)} trip(s), backend {STORAGE_BACKEND}, schema version {SCHEMA_VERSION}"
+          f"{' — dry run' if args.dry_run else ''}\n")
+    migrated, current, failed = 0, 0, 0
+    with ProcessPoolExecutor(args.workers, initializer=_init) as pool:
+        for key, version, done, error in pool.map(migrate_one, keys, [args.dry_run] * len(keys),
+                                                  chunksize=max(1, len(keys) // (args.workers * 4))):
+            if error:
+                failed += 1
+                print(f"  ✗ {key}: {error}")
+            elif done:
+                migrated += 1
+                print(f"  {'→' if args.dry_run else '✓'} {key}: v{version} → v{SCHEMA_VERSION} ({'; '.join(done)})")
+            else:
+                current += 1
+    elapsed = time.perf_counter() - start
+    verb    = "would be migrated" if args.dry_run else "migrated"
+    print(f"\n{migrated} {verb}, {current} already current, {failed} failed — {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
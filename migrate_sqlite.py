@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+One-shot import of the JSON trip files into the SQLite backend.
+
+Reads data.json (chat 'default') and every data/trip_<id>.json, and writes
+them into the database used by STORAGE_BACKEND=sqlite. Existing rows for the
+same chat are replaced; the JSON files are left untouched.
+
+Run: python3 migrate_sqlite.py [path/to/tripbot.db]
+"""
+import json, sys
+from pathlib import Path
+from storage import SqliteBackend
+
+DATA_DIR = Path("data")
+DB_PATH  = sys.argv[1] if len(sys.argv) > 1 else str(DATA_DIR / "tripbot.db")
+
+
+def sources():
+    if Path("data.json").exists():
+        yield "default", Path("data.json")
+    for fpath in sorted(DATA_DIR.glob("trip_*.json")):
+        if fpath.name.endswith(".snap.json"):
+            continue                                # journal backend snapshots, not trips of their own
+        yield fpath.name.removeprefix("trip_").removesuffix(".json"), fpath   # already the sanitised chat id
+
+
+def main():
+    backend = SqliteBackend(DB_PATH)
+    count   = 0
+    for key, fpath in sources():
+        try:
+            data = json.loads(fpath.read_text())
+        except ValueError as e:
+            print(f"  ✗ {fpath}: {e}")
+            continue
+        payload, size = backend.encode(key, data)
+        backend.write(key, payload)
+        count += 1
+        print(f"  ✓ {fpath} → {key} ({size} bytes)")
+    print(f"\nImported {count} trip(s) into {DB_PATH}")
+
+
+if __name__ == "__main__":
+    main()
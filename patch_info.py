@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """
 Patch refs (Info tab) for Morocco trip.
-Run: python3 patch_info.py
+Replaces refCats and refs server-side (see merge_sections.py).
+Run: ADMIN_TOKEN=… python3 patch_info.py
 """
-import json, urllib.request
+from merge_sections import merge, report
 
 CHAT_ID  = "-5046151729"
 BASE_URL = "https://tripobot-production.up.railway.app"
@@ -129,27 +130,9 @@ REFS = [
     },
 ]
 
-def fetch(url):
-    with urllib.request.urlopen(url) as r:
-        return json.loads(r.read())
-
-def post(url, payload):
-    body = json.dumps(payload).encode()
-    req  = urllib.request.Request(url, data=body,
-                                  headers={"Content-Type": "application/json"},
-                                  method="POST")
-    with urllib.request.urlopen(req) as r:
-        return json.loads(r.read())
-
-print("Fetching current data...")
-data = fetch(f"{BASE_URL}/api/data?chat_id={CHAT_ID}")
-
-data["refCats"] = REF_CATS
-data["refs"]    = REFS
 
 print("Saving...")
-result = post(f"{BASE_URL}/api/data?chat_id={CHAT_ID}", data)
-print("Done:", result)
+report(merge([CHAT_ID], {"refCats": REF_CATS, "refs": REFS}, mode="replace", base_url=BASE_URL))
 print(f"\n{len(REF_CATS)} categories, {len(REFS)} items:")
 for cat in REF_CATS:
     items = [r["title"] for r in REFS if r["catId"] == cat["id"]]
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """
 Patch wxLocations for Spain trip (26 Feb – 1 Mar 2026).
-Run: python3 patch_weather_spain.py
+Replaces wxLocations server-side (see merge_sections.py).
+Run: ADMIN_TOKEN=… python3 patch_weather_spain.py
 """
-import json, urllib.request
+from merge_sections import merge, report
 
 CHAT_ID  = "-1003724580501"
 BASE_URL = "https://tripobot-production.up.railway.app"  # ← your Railway URL
@@ -57,26 +58,10 @@ WX_LOCATIONS = [
 ]
 
 
-def fetch(url):
-    with urllib.request.urlopen(url) as r:
-        return json.loads(r.read())
-
-def post(url, payload):
-    body = json.dumps(payload).encode()
-    req  = urllib.request.Request(url, data=body,
-                                  headers={"Content-Type": "application/json"},
-                                  method="POST")
-    with urllib.request.urlopen(req) as r:
-        return json.loads(r.read())
-
-print("Fetching current data...")
-data = fetch(f"{BASE_URL}/api/data?chat_id={CHAT_ID}")
-
-data["wxLocations"] = WX_LOCATIONS
 
+# Only wxLocations is replaced; days, accoms, refs etc. are untouched server-side
 print("Saving...")
-result = post(f"{BASE_URL}/api/data?chat_id={CHAT_ID}", data)
-print("Done:", result)
+report(merge([CHAT_ID], {"wxLocations": WX_LOCATIONS}, mode="replace", base_url=BASE_URL))
 print(f"\n{len(WX_LOCATIONS)} weather locations set:")
 for loc in WX_LOCATIONS:
     print(f"  • {loc['name']} ({loc['dateFrom']} → {loc['dateTo']})")
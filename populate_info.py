@@ -2,10 +2,13 @@
 """
 Populate tripobot Info Board with key resources for the Spain trip.
 
+Existing categories and refs are kept; only new ids are added (see merge_sections.py).
+
 Usage:
-  python3 populate_info.py
+  ADMIN_TOKEN=… python3 populate_info.py
 """
-import json, sys, urllib.request
+import sys
+from merge_sections import merge, report
 
 BASE_URL = "https://tripobot-production.up.railway.app"  # ← paste your Railway URL here
 CHAT_ID  = "-1003724580501"
@@ -166,45 +169,14 @@ REFS = [
 
 # ─────────────────────────────────────────────────────────────────────────────
 
-def fetch(url):
-    with urllib.request.urlopen(url) as r:
-        return json.loads(r.read())
-
-def post(url, payload):
-    body = json.dumps(payload).encode()
-    req  = urllib.request.Request(url, data=body,
-                                  headers={"Content-Type": "application/json"},
-                                  method="POST")
-    with urllib.request.urlopen(req) as r:
-        return json.loads(r.read())
-
 def main():
     if "YOUR-APP" in BASE_URL:
         print("❌  Edit BASE_URL at the top of the script first.")
         sys.exit(1)
 
-    print(f"Fetching data for chat {CHAT_ID}...")
-    data = fetch(f"{BASE_URL}/api/data?chat_id={CHAT_ID}")
-
-    existing_cat_ids = {c["id"] for c in (data.get("refCats") or [])}
-    existing_ref_ids = {r["id"] for r in (data.get("refs")    or [])}
-
-    data.setdefault("refCats", [])
-    data.setdefault("refs",    [])
-
-    added_cats = added_refs = 0
-    for cat in CATS:
-        if cat["id"] not in existing_cat_ids:
-            data["refCats"].append(cat)
-            added_cats += 1
-
-    for ref in REFS:
-        if ref["id"] not in existing_ref_ids:
-            data["refs"].append(ref)
-            added_refs += 1
-
-    print(f"Saving — +{added_cats} categories, +{added_refs} refs...")
-    post(f"{BASE_URL}/api/data?chat_id={CHAT_ID}", data)
+    # Only categories and refs whose id isn't on the board yet are added, server-side
+    print(f"Merging into chat {CHAT_ID}...")
+    report(merge([CHAT_ID], {"refCats": CATS, "refs": REFS}, mode="insert", base_url=BASE_URL))
     print("✅  Done. Open the Info Board tab to see your resources.")
 
 if __name__ == "__main__":
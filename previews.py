@@ -0,0 +1,193 @@
+"""
+Downscaled previews of uploaded images and PDFs.
+
+After an upload is stored, its blob is queued for rendering; a few worker
+tasks take blobs off the queue and render them on a process pool (decoding
+and resizing is CPU-bound and would stall the event loop or the I/O
+threads). Each blob gets one JPEG per configured width, written next to the
+blob store as
+
+    data/uploads/variants/<h[:2]>/<h>_<width>.jpg
+
+Widths wider than the source image are skipped. PDFs get their first page
+rendered, which needs the optional pypdfium2 package; without it PDFs simply
+have no preview.
+
+The queue is bounded. When it is full the blob is not queued; the upload
+still succeeds and /api/preview queues it again the first time a preview is
+asked for. /api/preview serves the smallest variant at least as wide as
+requested, falling back to the original while variants don't exist yet.
+"""
+import asyncio, logging, multiprocessing, os, re, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+BLOB_URL   = re.compile(r"^/uploads/blobs/([0-9a-f]{2})/(\1[0-9a-f]{62})(\.[a-z0-9]+)?$")
+
+
+def previewable(path) -> bool:
+    ext = Path(path).suffix.lower()
+    return ext in IMAGE_EXTS or ext == ".pdf"
+
+
+# ── Rendering (runs in worker processes) ──────────────────────────────────────
+
+def _pdf_first_page(src: str, width: int):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return None
+    pdf = pdfium.PdfDocument(src)
+    try:
+        page = pdf[0]
+        return page.render(scale=width / page.get_width()).to_pil()
+    finally:
+        pdf.close()
+
+
+def render(src: str, out_dir: str, digest: str, widths: tuple) -> list:
+    """Write <digest>_<w>.jpg into out_dir for each width; returns the widths written."""
+    from PIL import Image, ImageOps
+    widest = max(widths)
+    if src.lower().endswith(".pdf"):
+        img = _pdf_first_page(src, widest)
+        if img is None:
+            return []
+    else:
+        img = Image.open(src)
+        img.draft("RGB", (widest, widest))     # JPEG: decode at a reduced scale directly
+        img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        bg  = Image.new("RGB", img.size, "white")
+        bg.paste(img, mask=img.getchannel("A"))
+        img = bg
+    img = img.convert("RGB")
+
+    os.makedirs(out_dir, exist_ok=True)
+    made = []
+    for w in sorted(widths, reverse=True):
+        if img.width <= w and made:
+            continue                            # never upscale; keep at least one variant
+        img.thumbnail((w, img.height), Image.LANCZOS)
+        dest = os.path.join(out_dir, f"{digest}_{w}.jpg")
+        tmp  = dest + ".tmp"
+        img.save(tmp, "JPEG", quality=80, optimize=True, progressive=True)
+        os.replace(tmp, dest)
+        made.append(w)
+    return made
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+
+class PreviewPipeline:
+    def __init__(self, uploads_dir: Path, run, widths=(160, 480, 1280),
+                 workers: int = 2, queue_max: int = 256):
+        """run(fn, *args) → awaitable running blocking disk access off the loop (IOPool.run)."""
+        self.root      = Path(uploads_dir)
+        self.out       = self.root / "variants"
+        self.widths    = tuple(sorted(widths))
+        self.workers   = workers
+        self.queue_max = queue_max
+        self._run      = run
+        self._queue    = None
+        self._pool     = None
+        self._tasks    = []
+        self._pending  = set()      # digests queued or rendering
+        self._blank    = set()      # digests that rendered to nothing (PDF without pypdfium2)
+        self.rendered  = 0
+        self.failed    = 0
+        self.dropped   = 0
+        self.busy_s    = 0.0
+
+    def start(self):
+        ctx         = multiprocessing.get_context("spawn")   # never fork the event-loop process
+        self._pool  = ProcessPoolExecutor(self.workers, mp_context=ctx)
+        self._queue = asyncio.Queue(self.queue_max)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def join(self):
+        """Wait until everything queued so far has been rendered."""
+        await self._queue.join()
+
+    # ── Queueing ──────────────────────────────────────────────────────────────
+
+    def submit(self, blob: Path) -> bool:
+        """Queue a blob for rendering without waiting; False if it was not queued."""
+        digest = blob.name.split(".", 1)[0]
+        if not previewable(blob) or digest in self._pending:
+            return False
+        if self._queue is None or self._queue.full():
+            self.dropped += 1
+            return False
+        self._pending.add(digest)
+        self._queue.put_nowait(blob)
+        return True
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            blob   = await self._queue.get()
+            digest = blob.name.split(".", 1)[0]
+            start  = time.perf_counter()
+            try:
+                made = await loop.run_in_executor(self._pool, render, str(blob),
+                                                  str(self.out / digest[:2]), digest, self.widths)
+                if not made:
+                    self._blank.add(digest)
+                self.rendered += 1
+            except Exception as e:
+                self.failed += 1
+                logging.warning(f"previews: could not render {blob.name}: {e}")
+            finally:
+                self.busy_s += time.perf_counter() - start
+                self._pending.discard(digest)
+                self._queue.task_done()
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+
+    def variant_files(self, blob: Path) -> list:
+        """Variant files that exist for a blob (blocking)."""
+        return list(self._variants(blob.name.split(".", 1)[0]).values())
+
+    def _variants(self, digest: str) -> dict:
+        shard = self.out / digest[:2]
+        return {w: shard / f"{digest}_{w}.jpg" for w in self.widths
+                if (shard / f"{digest}_{w}.jpg").exists()}
+
+    async def best(self, url: str, width: int):
+        """
+        (path, is_variant) for the best file to show url at `width` px, or None
+        if url is not a blob URL / the blob doesn't exist.
+        """
+        m = BLOB_URL.match(url or "")
+        if not m:
+            return None
+        blob = self.root / "blobs" / m.group(1) / f"{m.group(2)}{m.group(3) or ''}"
+        variants = await self._run(self._variants, m.group(2))
+        if variants:
+            fits = [w for w in variants if w >= width]
+            if fits:
+                return variants[min(fits)], True
+            if blob.suffix.lower() == ".pdf":
+                return variants[max(variants)], True
+        if not await self._run(blob.exists):
+            return None
+        if not variants and m.group(2) not in self._blank:
+            self.submit(blob)           # dropped earlier, or uploaded before previews existed
+        return blob, False
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0,
+                "rendered": self.rendered, "failed": self.failed, "dropped": self.dropped,
+                "busy_seconds": round(self.busy_s, 2)}
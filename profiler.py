@@ -0,0 +1,179 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+When PROFILE=1, ProfileMiddleware picks a fraction of /api/* and /webhook
+requests (PROFILE_SAMPLE_RATE), plus any request that carries the admin
+token in an X-Profile header or ?profile= parameter. Telegram updates
+handled in the background are sampled the same way via Profiler.begin() /
+end() in main.process_update.
+
+A sampler thread looks at the event loop thread's stack every `interval`
+seconds. Each request being profiled is known by the frame of the
+coroutine that started it; a sample whose stack passes through that frame
+is code running on behalf of that request, and is recorded as a collapsed
+stack ("outer;inner;innermost count"), the input format of flamegraph.pl
+and speedscope. Samples taken while the loop waits on I/O belong to no
+request, so a profile shows the loop time a request cost: JSON parsing,
+serialisation, handlers, Starlette and python-telegram-bot internals.
+
+Finished profiles are appended to <dir>/<route>__<chat>.folded, so the file
+for one chat and route builds up into an aggregate flame graph. The
+slowest `top` requests are kept in memory with their own stacks, for
+/api/admin/profiles.
+
+With PROFILE unset, neither the middleware nor the sampler thread exist.
+"""
+import asyncio, hmac, heapq, itertools, logging, random, re, sys, threading, time
+from pathlib import Path
+from urllib.parse import parse_qs
+
+_PROFILED = ("/api/", "/webhook")
+
+
+class _Profile:
+    __slots__ = ("route", "chat", "started", "ms", "samples")
+
+    def __init__(self, route: str, chat: str):
+        self.route   = route
+        self.chat    = chat
+        self.started = time.time()
+        self.ms      = 0.0
+        self.samples = {}           # collapsed stack → count
+
+
+def _label(code) -> str:
+    return f"{Path(code.co_filename).stem}:{code.co_qualname}"
+
+
+class Profiler:
+    def __init__(self, out_dir, run, rate: float = 0.01, interval: float = 0.005, top: int = 20,
+                 token: str = ""):
+        """
+        run(fn, *args) → awaitable running fn off the event loop (for the .folded writes)
+        token          → requests carrying it (X-Profile header or ?profile=) are always profiled
+        """
+        self.out_dir  = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._run     = run
+        self.rate     = rate
+        self.interval = interval
+        self.top      = top
+        self.token    = token
+        self._active  = {}          # frame of the coroutine being profiled → _Profile
+        self._lock    = threading.Lock()
+        self._wake    = threading.Event()
+        self._thread  = None
+        self._loop_id = None
+        self._slowest = []          # min-heap of (ms, seq, _Profile)
+        self._seq     = itertools.count()
+        self.profiled = 0
+        self.taken    = 0           # stack samples recorded
+
+    # ── Choosing ──────────────────────────────────────────────────────────────
+
+    def wants(self, forced_by: str = "") -> bool:
+        """Whether to profile a request; forced_by is the X-Profile / ?profile= value, if any."""
+        if forced_by and self.token and hmac.compare_digest(forced_by.encode(), self.token.encode()):
+            return True
+        return random.random() < self.rate
+
+    # ── Recording ─────────────────────────────────────────────────────────────
+
+    def begin(self, frame, route: str, chat: str = "") -> _Profile:
+        """Start attributing samples under frame (the caller's, on the event loop) to a new profile."""
+        if self._thread is None:
+            self._loop_id = threading.get_ident()
+            self._thread  = threading.Thread(target=self._sample_forever, name="tripbot-profiler", daemon=True)
+            self._thread.start()
+        profile = _Profile(route, chat)
+        with self._lock:
+            self._active[frame] = profile
+        self._wake.set()
+        return profile
+
+    def end(self, frame, route: str = None):
+        """Stop the profile started under frame; keep it if it is among the slowest, append it to disk."""
+        with self._lock:
+            profile = self._active.pop(frame, None)
+            if not self._active:
+                self._wake.clear()
+        if profile is None:
+            return
+        profile.ms = (time.time() - profile.started) * 1000
+        if route:
+            profile.route = route
+        self.profiled += 1
+        entry = (profile.ms, next(self._seq), profile)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, entry)
+        elif profile.ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+        if profile.samples:
+            path = self.out_dir / f"{_slug(profile.route)}__{_slug(profile.chat or 'none')}.folded"
+            task = asyncio.ensure_future(self._run(_append, path, dict(profile.samples)))
+            task.add_done_callback(lambda f: f.exception() and logging.warning(
+                f"Profiler: writing {path} failed: {f.exception()}"))
+
+    def _sample_forever(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._loop_id)
+            stack = []
+            with self._lock:
+                while frame is not None:
+                    profile = self._active.get(frame)
+                    if profile is not None:
+                        key = ";".join(reversed(stack)) or "(self)"
+                        profile.samples[key] = profile.samples.get(key, 0) + 1
+                        self.taken += 1
+                        break
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+            del frame
+
+    # ── Reporting ─────────────────────────────────────────────────────────────
+
+    def slowest(self) -> list:
+        """The slowest profiled requests, slowest first, each with its collapsed stacks."""
+        return [{"route": p.route, "chat": p.chat, "ms": round(p.ms, 1),
+                 "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(p.started)),
+                 "loop_ms": round(sum(p.samples.values()) * self.interval * 1000, 1),
+                 "folded": "\n".join(f"{k} {v}" for k, v in sorted(p.samples.items()))}
+                for _, _, p in sorted(self._slowest, reverse=True)]
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "interval": self.interval, "active": len(self._active),
+                "profiled": self.profiled, "samples": self.taken}
+
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_-]+", "_", str(s)).strip("_") or "root"
+
+
+def _append(path: Path, samples: dict):
+    with open(path, "a") as f:
+        f.writelines(f"{k} {v}\n" for k, v in samples.items())
+
+
+class ProfileMiddleware:
+    """ASGI middleware that profiles the requests Profiler.wants(); installed only when profiling is on."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app      = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(_PROFILED):
+            return await self.app(scope, receive, send)
+        query  = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        forced = dict(scope["headers"]).get(b"x-profile", b"").decode("latin-1") or query.get("profile", [""])[0]
+        if not self.profiler.wants(forced):
+            return await self.app(scope, receive, send)
+        frame = sys._getframe()
+        self.profiler.begin(frame, scope["path"], query.get("chat_id", [""])[0])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            self.profiler.end(frame, route.path if route is not None else None)
@@ -0,0 +1,120 @@
+"""
+Per-chat change notifications over Server-Sent Events.
+
+Every save goes through TripStore, which calls PushHub.on_change; the hub
+fans a compact notification out to every open /api/events stream of that
+chat:
+
+    event: change
+    data: {"rev": 42, "sections": ["expenses", "settlements"]}
+
+Clients compare rev with what they hold and re-fetch if they are behind.
+
+A subscriber holds no queue, just the newest revision it has not been sent
+and the union of sections changed since then, plus an asyncio.Event. A slow
+client therefore costs O(1) memory and, when it catches up, receives one
+merged notification instead of a backlog — that is the backpressure policy.
+Idle streams get a comment line every `heartbeat` seconds so proxies keep
+them open and dead connections are noticed.
+"""
+import asyncio, json, logging
+from docpatch import parse_pointer, PatchError
+from store import REV_KEY
+
+
+class HubFull(Exception):
+    pass
+
+
+class _Subscriber:
+    __slots__ = ("rev", "sections", "wake")
+
+    def __init__(self, rev: int):
+        self.rev      = rev
+        self.sections = set()
+        self.wake     = asyncio.Event()
+
+
+def _sections(ops) -> set:
+    if ops is None:
+        return {"*"}
+    out = set()
+    for op in ops:
+        try:
+            out.add(parse_pointer(op.get("path"))[0])
+        except (PatchError, AttributeError):
+            return {"*"}
+    return out
+
+
+class PushHub:
+    def __init__(self, heartbeat: float = 25.0, max_clients: int = 10000):
+        self.heartbeat   = heartbeat
+        self.max_clients = max_clients
+        self._subs: dict = {}           # chat key → set of _Subscriber
+        self.clients     = 0
+        self.published   = 0
+
+    # ── Publishing ────────────────────────────────────────────────────────────
+
+    def on_change(self, key: str, data: dict, ops):
+        subs = self._subs.get(key)
+        if not subs:
+            return
+        rev      = data.get(REV_KEY, 0)
+        sections = _sections(ops)
+        self.published += 1
+        for sub in subs:
+            sub.rev = rev
+            sub.sections |= sections
+            sub.wake.set()
+
+    # ── Subscribing ───────────────────────────────────────────────────────────
+
+    def subscribe(self, key: str, rev: int) -> _Subscriber:
+        if self.clients >= self.max_clients:
+            raise HubFull()
+        sub = _Subscriber(rev)
+        self._subs.setdefault(key, set()).add(sub)
+        self.clients += 1
+        return sub
+
+    def _unsubscribe(self, key: str, sub: _Subscriber):
+        subs = self._subs.get(key)
+        if subs and sub in subs:
+            subs.discard(sub)
+            self.clients -= 1
+            if not subs:
+                del self._subs[key]
+
+    async def stream(self, key: str, sub: _Subscriber, is_disconnected):
+        """SSE byte stream for one subscriber; ends when the client goes away."""
+        try:
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'rev': sub.rev})}\n\n".encode()
+            while True:
+                try:
+                    await asyncio.wait_for(sub.wake.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+                    yield b": ping\n\n"
+                    continue
+                sub.wake.clear()
+                event = {"rev": sub.rev, "sections": sorted(sub.sections)}
+                sub.sections = set()
+                yield f"id: {event['rev']}\nevent: change\ndata: {json.dumps(event)}\n\n".encode()
+        except Exception:
+            logging.exception(f"PushHub: stream for chat {key} failed")
+        finally:
+            self._unsubscribe(key, sub)
+
+    def chats(self) -> list:
+        """Chats with at least one open stream."""
+        return list(self._subs)
+
+    def behind(self, key: str, rev: int) -> bool:
+        """Whether any stream of chat key hasn't been told about rev yet."""
+        return any(sub.rev < rev for sub in self._subs.get(key, ()))
+
+    def stats(self) -> dict:
+        return {"clients": self.clients, "chats": len(self._subs), "published": self.published}
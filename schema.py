@@ -0,0 +1,125 @@
+"""
+Versioned schema of trip documents.
+
+Every document carries a schema_version. Migration steps are registered in
+order with @migration(version, description); upgrade() runs the steps newer
+than a document's version, stamps the new version, then fills in any
+top-level section missing from default_data(). load_data() in main.py calls
+it the first time an old trip is loaded and saves the result, so each trip
+is migrated once; migrate_schema.py upgrades every stored trip up front.
+
+Adding a schema change means appending a step with the next version number:
+
+    @migration(4, "rename foo → bar")
+    def _foo_to_bar(data):
+        ...
+
+Steps mutate the document in place and must cope with documents that never
+had the old shape.
+"""
+import copy, random, string, time
+
+SCHEMA_KEY = "schema_version"
+MIGRATIONS = []     # (version, description, step), ascending by version
+
+
+def migration(version: int, description: str):
+    def register(step):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"migration {version} registered after {MIGRATIONS[-1][0]}")
+        MIGRATIONS.append((version, description, step))
+        return step
+    return register
+
+
+def default_data() -> dict:
+    """Blank template used when a chat opens the app for the first time."""
+    return {
+        "trip":           {"name": "New Trip", "dates": ""},
+        "days":           [],
+        "accoms":         [],
+        "flights":        [],
+        "weather":        [],
+        "refs":           [],
+        "refCats":        [],
+        "groupChecklist": [],
+        "groupProgress":  {},
+        "wxLocations":    [],
+        "admins":         [],
+        "members":        [],
+        "expenses":       [],
+        "settlements":    [],
+        "tripCurrency":   {"base": "SGD", "rates": {"MAD": 0.29, "EUR": 1.45, "USD": 1.35}},
+        "wishlist":       [],
+        SCHEMA_KEY:       SCHEMA_VERSION
+    }
+
+
+# ── Steps ─────────────────────────────────────────────────────────────────────
+# 1–3 are the legacy conversions init() in static/index.html used to do in the browser.
+
+# Default checklist groups that the old flat checklist was split into
+_LEGACY_GROUPS = [{"id": "hiking", "label": "Hiking Gear", "icon": "🥾"},
+                  {"id": "snowboard", "label": "Snowboard Gear", "icon": "⛷️"},
+                  {"id": "admin", "label": "Trip Admin", "icon": "🚗"}]
+
+
+def _ms() -> int:
+    return int(time.time() * 1000)
+
+
+@migration(1, "checklist → groupChecklist")
+def _checklist_to_groups(data: dict):
+    if "checklist" in data and not data.get("groupChecklist"):
+        old = data.get("checklist") or {}
+        data["groupChecklist"] = [{**g, "items": old.get(g["id"], [])} for g in _LEGACY_GROUPS]
+        data["groupProgress"]  = {}
+    data.pop("checklist", None)
+
+
+@migration(2, "links → link refs")
+def _links_to_refs(data: dict):
+    refs = data.setdefault("refs", [])
+    for link in data.pop("links", None) or []:
+        suffix = "".join(random.choices(string.ascii_lowercase + string.digits, k=4))
+        refs.append({"id": f"r{_ms()}{suffix}", "type": "link", "cat": "uncategorized",
+                     "name": link.get("name"), "url": link.get("url")})
+
+
+@migration(3, "emergency numbers → note ref")
+def _emergency_to_note(data: dict):
+    numbers = data.pop("emergency", None)
+    if numbers:
+        content = "\n".join(f"{e.get('name')}: {e.get('number')}" for e in numbers)
+        data.setdefault("refs", []).append({"id": f"em{_ms()}", "type": "note", "cat": "uncategorized",
+                                            "name": "Emergency Numbers", "content": content})
+
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# ── Upgrading ─────────────────────────────────────────────────────────────────
+
+def needs_upgrade(data: dict) -> bool:
+    return data.get(SCHEMA_KEY, 0) < SCHEMA_VERSION
+
+
+def upgrade(data: dict, defaults: dict = None) -> list:
+    """
+    Bring data up to SCHEMA_VERSION in place and fill missing sections.
+    Returns what was done (step descriptions, "defaults: <keys>"); empty if nothing changed.
+    """
+    defaults = defaults or default_data()
+    done     = []
+    version  = data.get(SCHEMA_KEY, 0)
+    for v, description, step in MIGRATIONS:
+        if version < v:
+            step(data)
+            done.append(description)
+    data[SCHEMA_KEY] = max(version, SCHEMA_VERSION)
+    filled = [k for k in defaults if data.get(k) is None]
+    for key in filled:
+        data[key] = copy.deepcopy(defaults[key])
+    if filled:
+        done.append(f"defaults: {', '.join(filled)}")
+    return done
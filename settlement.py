@@ -0,0 +1,130 @@
+"""
+Settlement engine — per-member net balances and the simplified debt list.
+
+Mirrors computeSimplifiedDebts() in static/index.html, but keeps the net
+balances of each trip in memory and updates them from the docpatch ops of
+every save instead of re-walking all expenses and settlements (see
+derived.py for which ops are applied in place); anything touching
+/tripCurrency rebuilds the ledger from scratch.
+
+Amounts are converted to the trip's base currency at the rate of the day
+each expense or settlement was made, from the same dated rate provider as
+the spending summary (fxrates.py), falling back to tripCurrency.rates and
+then to the face value, as toBase() does. Ledgers are rebuilt whenever the
+provider's rates change.
+"""
+from collections import defaultdict
+from derived import SectionView, ViewBook
+
+_EPS = 0.005
+
+
+def _num(x) -> float:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Ledger(SectionView):
+    SECTIONS   = ("expenses", "settlements")
+    REBUILD_ON = ("tripCurrency",)
+
+    def __init__(self, rates):
+        self.fx_version = None
+        self.base       = "SGD"
+        self._rates     = rates
+        self._static    = {}
+        self.net        = defaultdict(float)
+        self._contrib   = {s: {} for s in self.SECTIONS}   # section → item id → {member: amount}
+        super().__init__()
+
+    # ── Contributions ─────────────────────────────────────────────────────────
+
+    def _to_base(self, amount, currency, date) -> float:
+        amount = _num(amount)
+        if currency == self.base:
+            return amount
+        rate = self._rates.rate(currency, self.base, date) or self._static.get(currency)
+        return amount * rate if rate else amount
+
+    def _contribution(self, section: str, item) -> dict:
+        out = defaultdict(float)
+        if not isinstance(item, dict):
+            return out
+        if section == "settlements":
+            amt = self._to_base(item.get("amount"), item.get("currency"), item.get("date"))
+            out[item.get("fromMember")] += amt
+            out[item.get("toMember")]   -= amt
+            return out
+        cur, day = item.get("currency"), item.get("date")
+        payments = item.get("payments")
+        if isinstance(payments, dict) and payments:
+            for mid, paid in payments.items():
+                out[mid] += self._to_base(paid, cur, day)
+        else:
+            out[item.get("paidBy")] += self._to_base(item.get("amount"), cur, day)
+        for mid, share in (item.get("splits") or {}).items():
+            out[mid] -= self._to_base(share, cur, day)
+        return out
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def _reset(self, data: dict):
+        fx              = data.get("tripCurrency") or {}
+        self.base       = fx.get("base") or "SGD"
+        self._static    = {k: _num(v) for k, v in (fx.get("rates") or {}).items()}
+        self.fx_version = self._rates.version
+        self.net        = defaultdict(float)
+        self._contrib   = {s: {} for s in self.SECTIONS}
+
+    def _add(self, section: str, key, item: dict):
+        contrib = self._contrib[section][key] = self._contribution(section, item)
+        for mid, amt in contrib.items():
+            self.net[mid] += amt
+
+    def _drop(self, section: str, key):
+        for mid, amt in self._contrib[section].pop(key, {}).items():
+            self.net[mid] -= amt
+
+    def current(self, data: dict) -> bool:
+        return super().current(data) and self.fx_version == self._rates.version
+
+    # ── Output ────────────────────────────────────────────────────────────────
+
+    def _net(self, members: list) -> dict:
+        net = {m.get("id"): 0.0 for m in members if isinstance(m, dict)}
+        for mid, amt in self.net.items():
+            if mid is not None and (mid in net or abs(amt) > _EPS):
+                net[mid] = amt
+        return net
+
+    def balances(self, members: list) -> dict:
+        """Net balance per member in the base currency (positive = is owed money)."""
+        return {mid: round(amt, 2) for mid, amt in self._net(members).items()}
+
+    def debts(self, members: list) -> list:
+        """Greedy largest-creditor / largest-debtor matching, as on the client."""
+        net       = self._net(members)
+        creditors = sorted(([m, b] for m, b in net.items() if b > _EPS),  key=lambda c: -c[1])
+        debtors   = sorted(([m, -b] for m, b in net.items() if b < -_EPS), key=lambda d: -d[1])
+        out, ci, di = [], 0, 0
+        while ci < len(creditors) and di < len(debtors):
+            settled = min(creditors[ci][1], debtors[di][1])
+            if settled > _EPS:
+                out.append({"from": debtors[di][0], "to": creditors[ci][0],
+                            "amount": round(settled, 2), "currency": self.base})
+            creditors[ci][1] -= settled
+            debtors[di][1]   -= settled
+            if creditors[ci][1] < _EPS:
+                ci += 1
+            if debtors[di][1] < _EPS:
+                di += 1
+        return out
+
+
+class LedgerBook(ViewBook):
+    """Ledgers for the chats that have asked for balances, kept current by store updates."""
+
+    def __init__(self, rates):
+        super().__init__(lambda: Ledger(rates), rates)
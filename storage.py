@@ -0,0 +1,390 @@
+"""
+Storage backends behind TripStore.
+
+A backend turns trip documents into something durable and back. TripStore
+drives it in three steps so that nothing blocking runs on the event loop:
+
+    read(key)                  → (dict, size_in_bytes) or None      [blocking, I/O pool]
+    encode(key, data, changes) → (payload, size_in_bytes or None)   [event loop]
+    write(key, payload)        → None                               [blocking, I/O pool]
+    forget(key)                → None, the store evicted this chat  [event loop]
+
+and, for TripStore(shared=True) with several worker processes:
+
+    version(key)               → token that changes on every write  [blocking, I/O pool]
+    lock(key)                  → context manager, exclusive across processes (fcntl)
+
+encode() must capture everything write() needs, because the document may be
+mutated again as soon as it returns. `changes` is the list of change records
+({"rev", "ts", "by", "ops"}) since the last write, or None when they are not
+known and the whole document has to be written. encode() returns size None
+when the payload says nothing about the document's size (a journal append).
+
+    JsonFileBackend — one pretty-printed JSON file per chat (the original layout)
+    SqliteBackend   — one SQLite database in WAL mode, list sections as indexed rows
+    JournalBackend  — per-chat append-only change journal plus a compact snapshot
+"""
+import fcntl, json, logging, os, sqlite3, threading
+from contextlib import contextmanager
+from pathlib import Path
+from store import REV_KEY
+from docpatch import apply_patch, PatchError
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive advisory lock on path, across processes, for the duration of the block."""
+    with open(path, "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def atomic_write(path: Path, raw: bytes):
+    """Write to a temp file, fsync and rename over path — readers see the old or the new file, never half."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _stat_token(*paths) -> tuple:
+    out = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            out.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            out.append(None)
+    return tuple(out)
+
+
+class JsonFileBackend:
+    def __init__(self, path_for):
+        self._path_for = path_for       # key → Path
+
+    def read(self, key):
+        fpath = self._path_for(key)
+        if not fpath.exists():
+            return None
+        raw = fpath.read_bytes()
+        return json.loads(raw), len(raw)
+
+    def encode(self, key, data: dict, changes=None):
+        raw = _dumps(data).encode()
+        return raw, len(raw)
+
+    def write(self, key, raw: bytes):
+        atomic_write(self._path_for(key), raw)
+
+    def forget(self, key):
+        pass
+
+    def version(self, key):
+        return _stat_token(self._path_for(key))
+
+    def lock(self, key):
+        return file_lock(self._path_for(key).with_suffix(".lock"))
+
+
+# ── SQLite ────────────────────────────────────────────────────────────────────
+
+# List sections stored one row per item, with the columns worth indexing.
+# Everything else in the document stays in trips.doc as JSON.
+_ROW_SECTIONS = {
+    "expenses":    ("expenses",    ("date", "paidBy", "category", "currency")),
+    "settlements": ("settlements", ("date", "fromMember", "toMember")),
+    "refs":        ("refs",        ("cat", "type")),
+}
+_PROGRESS = "groupProgress"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    chat_id TEXT PRIMARY KEY,
+    rev     INTEGER NOT NULL DEFAULT 0,
+    doc     TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    chat_id TEXT NOT NULL, id TEXT NOT NULL, pos INTEGER NOT NULL,
+    date TEXT, paidBy TEXT, category TEXT, currency TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (chat_id, id)
+);
+CREATE INDEX IF NOT EXISTS expenses_date     ON expenses (chat_id, date);
+CREATE INDEX IF NOT EXISTS expenses_paid_by  ON expenses (paidBy);
+CREATE INDEX IF NOT EXISTS expenses_category ON expenses (category);
+CREATE TABLE IF NOT EXISTS settlements (
+    chat_id TEXT NOT NULL, id TEXT NOT NULL, pos INTEGER NOT NULL,
+    date TEXT, fromMember TEXT, toMember TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (chat_id, id)
+);
+CREATE INDEX IF NOT EXISTS settlements_date ON settlements (chat_id, date);
+CREATE TABLE IF NOT EXISTS refs (
+    chat_id TEXT NOT NULL, id TEXT NOT NULL, pos INTEGER NOT NULL,
+    cat TEXT, type TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (chat_id, id)
+);
+CREATE INDEX IF NOT EXISTS refs_cat ON refs (chat_id, cat);
+CREATE TABLE IF NOT EXISTS progress (
+    chat_id TEXT NOT NULL, key TEXT NOT NULL,
+    value   TEXT NOT NULL,
+    PRIMARY KEY (chat_id, key)
+);
+"""
+
+
+def _dumps(x) -> str:
+    return json.dumps(x, ensure_ascii=False, separators=(",", ":"))
+
+
+def _col(v):
+    """Indexed column value — scalars as text, anything else left NULL."""
+    return None if v is None or isinstance(v, (dict, list)) else str(v)
+
+
+def _row_ids(items: list) -> list:
+    """Stable row keys: the item's own id, or its position if missing or duplicated."""
+    seen, ids = set(), []
+    for pos, item in enumerate(items):
+        rid = item.get("id") if isinstance(item, dict) else None
+        rid = str(rid) if rid is not None else None
+        if rid is None or rid in seen:
+            rid = f"#{pos}"
+        seen.add(rid)
+        ids.append(rid)
+    return ids
+
+
+class SqliteBackend:
+    """
+    Trips live in one database. Large list sections (expenses, settlements,
+    refs) and checklist progress are split into their own tables, one row per
+    item, so a save only rewrites the rows that actually changed. The rest of
+    the document is stored as JSON in trips.doc, with an empty placeholder
+    where each split-out section goes.
+    """
+
+    def __init__(self, path, key_for=str):
+        self.path     = Path(path)
+        self._key_for = key_for         # chat key → trips.chat_id (matches the JSON file names)
+        self._local   = threading.local()
+        self._written: dict = {}        # key → last rows written, to diff against
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ── Encoding ──────────────────────────────────────────────────────────────
+
+    def encode(self, key, data: dict, changes=None):
+        """Split the document into (doc_json, {table: {row_id: row_tuple}}) on the loop."""
+        doc, tables, size = dict(data), {}, 0
+        for section, (table, cols) in _ROW_SECTIONS.items():
+            items = doc.get(section)
+            if not isinstance(items, list):
+                continue
+            rows = {}
+            for pos, (rid, item) in enumerate(zip(_row_ids(items), items)):
+                body  = _dumps(item)
+                size += len(body)
+                get   = item.get if isinstance(item, dict) else (lambda _c: None)
+                rows[rid] = (pos, *(_col(get(c)) for c in cols), body)
+            tables[table] = rows
+            doc[section]  = []
+        progress = doc.get(_PROGRESS)
+        if isinstance(progress, dict):
+            rows = {str(k): _dumps(v) for k, v in progress.items()}
+            size += sum(len(k) + len(v) for k, v in rows.items())
+            tables["progress"] = rows
+            doc[_PROGRESS]     = {}
+        doc_json = _dumps(doc)
+        return (doc_json, data.get(REV_KEY, 0), tables), size + len(doc_json)
+
+    # ── Reads / writes ────────────────────────────────────────────────────────
+
+    def forget(self, key):
+        self._written.pop(self._key_for(key), None)
+
+    def version(self, key):
+        row = self._conn().execute("SELECT rev FROM trips WHERE chat_id = ?", (self._key_for(key),)).fetchone()
+        return row[0] if row else None
+
+    def lock(self, key):
+        locks = self.path.with_name(self.path.name + ".locks")
+        locks.mkdir(exist_ok=True)
+        return file_lock(locks / f"{self._key_for(key)}.lock")
+
+    def read(self, key):
+        key  = self._key_for(key)
+        conn = self._conn()
+        row  = conn.execute("SELECT doc FROM trips WHERE chat_id = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        doc, size, written = json.loads(row[0]), len(row[0]), {}
+        for section, (table, cols) in _ROW_SECTIONS.items():
+            rows = conn.execute(
+                f"SELECT id, pos, {', '.join(cols)}, body FROM {table} WHERE chat_id = ? ORDER BY pos",
+                (key,)).fetchall()
+            written[table] = {r[0]: tuple(r[1:]) for r in rows}
+            if doc.get(section) == []:
+                doc[section] = [json.loads(r[-1]) for r in rows]
+            size += sum(len(r[-1]) for r in rows)
+        rows = conn.execute("SELECT key, value FROM progress WHERE chat_id = ?", (key,)).fetchall()
+        written["progress"] = dict(rows)
+        if doc.get(_PROGRESS) == {}:
+            doc[_PROGRESS] = {k: json.loads(v) for k, v in rows}
+        size += sum(len(k) + len(v) for k, v in rows)
+        self._written[key] = written
+        return doc, size
+
+    def write(self, key, payload):
+        doc_json, rev, tables = payload
+        key  = self._key_for(key)
+        conn = self._conn()
+        old  = self._written.get(key)
+        if old is None:
+            self.read(key)
+            old = self._written.get(key, {})
+        with conn:
+            conn.execute(
+                "INSERT INTO trips (chat_id, rev, doc) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET rev = excluded.rev, doc = excluded.doc",
+                (key, rev, doc_json))
+            for section, (table, cols) in _ROW_SECTIONS.items():
+                self._sync_rows(conn, key, table, ("pos", *cols, "body"),
+                                old.get(table, {}), tables.get(table, {}))
+            self._sync_rows(conn, key, "progress", ("value",),
+                            old.get("progress", {}), tables.get("progress", {}))
+        self._written[key] = tables
+
+    @staticmethod
+    def _sync_rows(conn, key, table, cols, old: dict, new: dict):
+        id_col = "key" if table == "progress" else "id"
+        gone   = [(key, rid) for rid in old if rid not in new]
+        if gone:
+            conn.executemany(f"DELETE FROM {table} WHERE chat_id = ? AND {id_col} = ?", gone)
+        changed = [(key, rid, *(row if isinstance(row, tuple) else (row,)))
+                   for rid, row in new.items() if old.get(rid) != row]
+        if changed:
+            marks  = ", ".join("?" * (len(cols) + 2))
+            update = ", ".join(f"{c} = excluded.{c}" for c in cols)
+            conn.executemany(
+                f"INSERT INTO {table} (chat_id, {id_col}, {', '.join(cols)}) VALUES ({marks}) "
+                f"ON CONFLICT (chat_id, {id_col}) DO UPDATE SET {update}",
+                changed)
+
+
+# ── Journal ───────────────────────────────────────────────────────────────────
+
+class JournalError(Exception):
+    pass
+
+
+class JournalBackend:
+    """
+    Each save appends one compact JSON line per change record to
+    trip_<id>.journal instead of rewriting the document, so a save costs
+    O(change) rather than O(document). Once the journal holds `compact_every`
+    records the next write is a full snapshot (trip_<id>.snap.json, compact
+    encoding, written to a temp file and renamed) and the journal is rotated
+    to trip_<id>.journal.1, which keeps the previous generation as an audit
+    trail of who changed what.
+
+    Loading reads the snapshot — or the plain trip_<id>.json when a chat has
+    never been written by this backend — and replays journal records newer
+    than its revision in order. A torn final line from a crash mid-append is
+    cut off, so replay always ends on the last complete record. Any other
+    record that can't be decoded or applied raises JournalError and leaves
+    the files as they are, rather than discarding everything after it.
+    """
+
+    def __init__(self, path_for, compact_every: int = 200):
+        self._path_for     = path_for       # key → Path of the plain JSON file
+        self.compact_every = compact_every
+        self._records: dict = {}            # key → records in the current journal
+
+    def _paths(self, key):
+        plain = self._path_for(key)
+        stem  = plain.with_suffix("")
+        return plain, stem.with_suffix(".snap.json"), stem.with_suffix(".journal")
+
+    def forget(self, key):
+        self._records.pop(key, None)
+
+    def version(self, key):
+        plain, snap, journal = self._paths(key)
+        return _stat_token(plain, snap, journal)
+
+    def lock(self, key):
+        return file_lock(self._path_for(key).with_suffix(".lock"))
+
+    def read(self, key):
+        plain, snap, journal = self._paths(key)
+        base = snap if snap.exists() else plain
+        if not base.exists() and not journal.exists():
+            return None
+        raw  = base.read_bytes() if base.exists() else b"{}"
+        data = json.loads(raw)
+        size = len(raw)
+        if journal.exists():
+            count, good = 0, 0
+            with open(journal, "rb") as f:
+                lines = f.readlines()
+            for n, line in enumerate(lines, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    if n < len(lines):
+                        raise JournalError(f"{journal}: record {n} is not valid JSON: {e}")
+                    # A torn final append: cut it off so replay ends on the last complete record
+                    logging.warning(f"JournalBackend: {journal} truncated at byte {good}: {e}")
+                    os.truncate(journal, good)
+                    break
+                try:
+                    if record["rev"] > data.get(REV_KEY, 0):
+                        apply_patch(data, record["ops"])
+                        data[REV_KEY] = record["rev"]
+                except (KeyError, TypeError, PatchError) as e:
+                    raise JournalError(f"{journal}: record {n} does not apply: {e}") from e
+                good  += len(line)
+                count += 1
+            self._records[key] = count
+            size += good
+        return data, size
+
+    def encode(self, key, data: dict, changes=None):
+        if changes is None or self._records.get(key, 0) + len(changes) > self.compact_every:
+            raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+            return ("snapshot", raw), len(raw)
+        lines = b"".join(json.dumps(c, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+                         for c in changes)
+        return ("append", lines, len(changes)), None
+
+    def write(self, key, payload):
+        plain, snap, journal = self._paths(key)
+        if payload[0] == "append":
+            _, lines, count = payload
+            with open(journal, "ab") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._records[key] = self._records.get(key, 0) + count
+            return
+        _, raw = payload
+        atomic_write(snap, raw)
+        if journal.exists():
+            os.replace(journal, journal.with_suffix(".journal.1"))
+        self._records[key] = 0
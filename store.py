@@ -0,0 +1,416 @@
+"""
+In-memory trip store with write-behind flushing.
+
+Sits in front of the on-disk trip files: the first read of a chat parses its
+file once, later reads are served from memory, and saves only mark the entry
+dirty. Dirty entries are written out together after a short debounce, so a
+burst of taps from a dozen members becomes a single disk write per chat.
+
+The cache is bounded by entry count and approximate byte size (the length of
+the last serialised form), and entries idle for longer than `idle_ttl` are
+dropped. Dirty entries are never evicted until they have been flushed.
+
+Every put() bumps the document's revision (stored in the document itself under
+REV_KEY), which callers use for ETags and optimistic concurrency.
+
+How documents reach the disk is up to the backend (storage.py). Its reads and
+writes are handed to `run` (IOPool.run) so they never block the event loop;
+encoding happens on the loop, because cached documents are mutated in place by
+handlers and must not be walked from another thread.
+
+With shared=True several processes (uvicorn --workers N) can serve the same
+chats. Each cached entry remembers the backend's version token (file stat or
+stored revision) it was read or written at:
+
+  - get() compares that token with the backend's current one and reloads
+    the chat when another process has written it since;
+  - a flush takes the chat's cross-process lock, and if the version moved
+    on since this process last read it, re-reads the other process's
+    document and replays this process's pending change records on top
+    instead of overwriting it. Only records made of appends ("add …/-")
+    are replayed, since index-addressed ops would land on whatever item now
+    sits at that index; any other record, or one that no longer applies,
+    is dropped with a warning. A pending full write (no ops known) gives
+    way to the other process's copy.
+
+Conditional writes (If-Match) must not go through that rebase at all: they
+run inside locked(), which holds the chat's lock across the read, the
+check and a write-through, so the check is made against what is on disk.
+
+Listeners are called with ops=None whenever a chat is replaced that way.
+"""
+import asyncio, copy, logging, time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, nullcontext
+from docpatch import apply_patch, PatchError
+
+REV_KEY = "_rev"
+_UNSAVED   = object()   # version of a chat created here and not yet written (shared mode)
+_RETRY_MAX = 60.0       # seconds; longest wait before retrying after failed flushes
+
+
+def revision(data: dict) -> int:
+    return data.get(REV_KEY, 0) if data else 0
+
+
+def _appends_only(ops) -> bool:
+    return all(isinstance(op, dict) and op.get("op") == "add" and str(op.get("path", "")).endswith("/-")
+               for op in ops)
+
+
+class _Entry:
+    __slots__ = ("data", "size", "touched", "dirty", "changes", "version", "busy")
+
+    def __init__(self, data: dict, size: int, changes=None, version=None):
+        self.data    = data
+        self.size    = size
+        self.touched = time.monotonic()
+        self.dirty   = False
+        self.changes = changes      # change records since the last flush; None = unknown, write it all
+        self.version = version      # backend version token this copy is based on (shared mode)
+        self.busy    = False        # a flush of this entry is in progress
+
+
+class TripStore:
+    def __init__(self, backend, run, max_entries: int = 256,
+                 max_bytes: int = 64 << 20, idle_ttl: float = 900.0, flush_delay: float = 1.0,
+                 shared: bool = False, observe=None):
+        """
+        backend        → a storage.py backend (read / encode / write, plus version / lock if shared)
+        run(fn, *args) → awaitable running fn off the event loop
+        shared         → other processes write the same backend; see the module docstring
+        observe(op, seconds, size) → called after each backend "read" and "write" (metrics)
+        """
+        self.backend      = backend
+        self._run         = run
+        self.max_entries  = max_entries
+        self.max_bytes    = max_bytes
+        self.idle_ttl     = idle_ttl
+        self.flush_delay  = flush_delay
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._loading: dict = {}
+        self._bytes       = 0
+        self._timer       = None
+        self._failures    = 0       # flushes failed in a row, for the retry backoff
+        self._flush_lock  = asyncio.Lock()
+        self._listeners   = []
+        self._evictees    = []
+        self.shared       = shared
+        self._observe     = observe
+        self._stale       = set()   # shared: chats dropped because another process wrote them
+        self._held        = set()   # shared: chats inside locked() here, whose flushes the holder does
+        self._owned       = set()   # shared: chats whose cross-process lock this process holds now
+        self._gates: dict = {}      # shared: chat → [asyncio.Lock, users, holding task] for locked() here
+        self._flushing    = {}      # chat → future done when its flush in progress ends
+        self.hits         = 0
+        self.misses       = 0
+        self.reloads      = 0       # shared: chats re-read after another process wrote them
+        self.rebases      = 0       # shared: flushes replayed on top of another process's write
+
+    def subscribe(self, fn):
+        """Call fn(key, data, ops) after every put(), e.g. to keep derived indexes current."""
+        self._listeners.append(fn)
+
+    def on_evict(self, fn):
+        """Call fn(key) when a chat leaves the cache, so state derived from it can be let go too."""
+        self._evictees.append(fn)
+
+    # ── Reads / writes ────────────────────────────────────────────────────────
+
+    async def get(self, chat_id):
+        """Return the cached document for chat_id, loading it on a miss. None if absent."""
+        key   = str(chat_id)
+        entry = self._entries.get(key)
+        if entry is not None and self.shared and not (entry.dirty or entry.busy):
+            version = await self._run(self.backend.version, key)
+            entry   = self._entries.get(key)
+            if entry is not None and version != entry.version and not (entry.dirty or entry.busy):
+                self.reloads += 1
+                self._stale.add(key)
+                self._drop(key, entry)
+                entry = None
+        if entry is not None:
+            self.hits += 1
+            self._touch(key, entry)
+            return entry.data
+        self.misses += 1
+        if key in self._held:
+            # Not a shared read: one started outside locked() may be waiting for the lock held here
+            return await self._load(key)
+        # Concurrent misses for the same chat share a single disk read.
+        pending = self._loading.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(key))
+            self._loading[key] = pending
+            pending.add_done_callback(lambda _f: self._loading.pop(key, None))
+        return await asyncio.shield(pending)
+
+    def _read_versioned(self, key: str):
+        if not self.shared:
+            return None, self.backend.read(key)
+        with nullcontext() if key in self._owned else self.backend.lock(key):  # never see a write half done
+            return self.backend.version(key), self.backend.read(key)
+
+    async def _load(self, key: str):
+        start           = time.perf_counter()
+        version, loaded = await self._run(self._read_versioned, key)
+        if self._observe and loaded is not None:
+            self._observe("read", time.perf_counter() - start, loaded[1])
+        entry  = self._entries.get(key)         # a put() may have raced the read
+        if entry is not None:
+            return entry.data
+        if loaded is None:
+            return None
+        data, size = loaded
+        self._insert(key, _Entry(data, size, changes=[], version=version))
+        if key in self._stale:
+            self._stale.discard(key)
+            self._notify(key, data, None)       # another process changed it; derived state must catch up
+        return data
+
+    @asynccontextmanager
+    async def locked(self, chat_id):
+        """
+        Shared mode: hold chat_id's cross-process lock for a read-check-write.
+
+        Inside, get() returns the chat as it is on disk now (after writing out
+        any changes still pending here), so an If-Match check against it can't
+        race another process; what put() stores inside is written through
+        before the lock is released. Re-entrant within one task; does nothing
+        when not shared.
+        """
+        key  = str(chat_id)
+        gate = self._gates.get(key)
+        if not self.shared or gate is not None and gate[2] is asyncio.current_task():
+            yield
+            return
+        gate = self._gates.setdefault(key, [asyncio.Lock(), 0, None])
+        gate[1] += 1
+        try:
+            async with gate[0]:
+                gate[2] = asyncio.current_task()
+                self._held.add(key)
+                try:
+                    # A flush already under way may be waiting for the lock: let it finish first
+                    if key in self._flushing:
+                        await asyncio.shield(self._flushing[key])
+                    lock = self.backend.lock(key)
+                    await self._run(lock.__enter__)
+                    self._owned.add(key)
+                    try:
+                        await self._write_through(key)
+                        yield
+                        await self._write_through(key)
+                    finally:
+                        self._owned.discard(key)
+                        await self._run(lock.__exit__, None, None, None)
+                finally:
+                    self._held.discard(key)
+                    gate[2] = None
+        finally:
+            gate[1] -= 1
+            if not gate[1]:
+                del self._gates[key]
+
+    async def _write_through(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry.dirty and not entry.busy:
+            await self._flush_entry(key, entry)
+
+    def create(self, chat_id, data: dict) -> dict:
+        """
+        put() data as a new chat unless a concurrent request created it while both
+        waited on get(); returns whichever document is now cached.
+        """
+        entry = self._entries.get(str(chat_id))
+        if entry is not None:
+            return entry.data
+        self.put(chat_id, data)
+        return data
+
+    def put(self, chat_id, data: dict, ops=None, author=None) -> int:
+        """
+        Replace the cached document, bump its revision and schedule a write-behind flush.
+
+        ops, when given, are the docpatch ops that turned the previous revision
+        into this one; backends that journal changes write those instead of the
+        whole document. author is recorded alongside them.
+        """
+        key   = str(chat_id)
+        entry = self._entries.get(key)
+        rev   = revision(entry.data if entry is not None else data) + 1
+        data[REV_KEY] = rev
+        if entry is None:
+            entry = _Entry(data, 0)
+            self._insert(key, entry)
+            if self.shared:
+                # Another process may create the same chat first; the new document then
+                # gives way to theirs and only the ops that follow are replayed on it
+                entry.changes, entry.version = [], _UNSAVED
+        else:
+            entry.data = data
+            self._touch(key, entry)
+            if entry.changes is not None:
+                if ops is None:
+                    entry.changes = None
+                else:
+                    # Copied now: op values are inserted into the document, which is edited in
+                    # place afterwards, and the record is only encoded at the next flush
+                    entry.changes.append({"rev": rev, "ts": int(time.time()), "by": author,
+                                          "ops": copy.deepcopy(ops)})
+        entry.dirty = True
+        self._schedule_flush()
+        self._notify(key, data, ops)
+        return rev
+
+    def _notify(self, key: str, data: dict, ops):
+        for fn in self._listeners:
+            try:
+                fn(key, data, ops)
+            except Exception:
+                logging.exception(f"TripStore: listener {fn!r} failed for chat {key}")
+
+    # ── Flushing ──────────────────────────────────────────────────────────────
+
+    async def flush(self, chat_id=None):
+        """Write dirty entries to disk now — one chat, or all of them."""
+        async with self._flush_lock:
+            keys = [str(chat_id)] if chat_id is not None else list(self._entries)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry.dirty and key not in self._held:
+                    await self._flush_entry(key, entry)     # held ones are written through by the holder
+
+    def dirty_count(self) -> int:
+        return sum(1 for e in self._entries.values() if e.dirty)
+
+    async def _flush_entry(self, key: str, entry: _Entry):
+        changes       = entry.changes
+        payload, size = self.backend.encode(key, entry.data, None if entry.version is _UNSAVED else changes)
+        entry.dirty   = False
+        entry.changes = []
+        entry.busy    = True
+        done          = self._flushing[key] = asyncio.get_running_loop().create_future()
+        start         = time.perf_counter()
+        try:
+            if self.shared:
+                version, theirs = await self._run(self._commit, key, payload, changes, entry.version)
+            else:
+                await self._run(self.backend.write, key, payload)
+        except Exception:
+            entry.dirty   = True
+            entry.changes = None        # the lost changes are only recoverable as a full write
+            self._failures += 1
+            logging.exception(f"TripStore: flush failed for chat {key}")
+            self._schedule_flush(min(self.flush_delay * 2 ** self._failures, _RETRY_MAX))
+            return
+        finally:
+            entry.busy = False
+            self._flushing.pop(key, None)
+            done.set_result(None)
+        self._failures = 0
+        if self.shared:
+            if theirs is None:
+                entry.version = version
+            elif not entry.dirty:
+                # Another process wrote first; what is on disk now is the merge
+                entry.data, entry.version = theirs, version
+                self._notify(key, theirs, None)
+            # else: saved again meanwhile — keep the old version so the next flush rebases too
+        if size is not None:
+            self._bytes += size - entry.size
+            entry.size   = size
+        if self._observe:
+            self._observe("write", time.perf_counter() - start, entry.size)
+
+    def _commit(self, key: str, payload, changes, base):
+        """
+        Shared mode, on the I/O pool: write payload under the chat's lock if nobody
+        else wrote since `base`, else replay `changes` onto their copy and write that.
+        Returns (new version, None) or (new version, the document now on disk).
+        """
+        with nullcontext() if key in self._owned else self.backend.lock(key):
+            if self.backend.version(key) == base or (loaded := self.backend.read(key)) is None:
+                self.backend.write(key, payload)
+                return self.backend.version(key), None
+            theirs = loaded[0]
+            if changes is None:
+                logging.warning(f"TripStore: chat {key} was written by another process; "
+                                f"a pending full write gives way to it")
+                return self.backend.version(key), theirs
+            rev, replayed = revision(theirs), []
+            for change in changes:
+                if not _appends_only(change["ops"]):
+                    logging.warning(f"TripStore: chat {key}: dropped change {change['rev']} "
+                                    f"by {change.get('by')} on rebase: conflicts with another process's write")
+                    continue
+                try:
+                    # Copied so the record stays as it was when encoded below, not aliased into theirs
+                    apply_patch(theirs, copy.deepcopy(change["ops"]))
+                except PatchError as e:
+                    logging.warning(f"TripStore: chat {key}: dropped change {change['rev']} "
+                                    f"by {change.get('by')} on rebase: {e}")
+                    continue
+                rev += 1
+                replayed.append({**change, "rev": rev})
+            theirs[REV_KEY] = rev
+            self.rebases   += 1
+            if replayed:
+                self.backend.write(key, self.backend.encode(key, theirs, replayed)[0])
+            return self.backend.version(key), theirs
+
+    def _schedule_flush(self, delay: float = None):
+        if self._timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(self.flush_delay if delay is None else delay, self._flush_due)
+
+    def _flush_due(self):
+        self._timer = None
+        asyncio.ensure_future(self._flush_and_evict())
+
+    async def _flush_and_evict(self):
+        await self.flush()
+        self._evict()
+
+    # ── Eviction ──────────────────────────────────────────────────────────────
+
+    def _touch(self, key: str, entry: _Entry):
+        entry.touched = time.monotonic()
+        self._entries.move_to_end(key)
+
+    def _insert(self, key: str, entry: _Entry):
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):      # oldest first
+            over = len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            idle = now - entry.touched > self.idle_ttl
+            if not (over or idle):
+                break
+            if entry.dirty or entry.busy:
+                continue            # kept until the pending flush has written it
+            self._drop(key, entry)
+
+    def _drop(self, key: str, entry: _Entry):
+        del self._entries[key]
+        self._bytes -= entry.size
+        self.backend.forget(key)
+        for fn in self._evictees:
+            try:
+                fn(key)
+            except Exception:
+                logging.exception(f"TripStore: evict listener {fn!r} failed for chat {key}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes":   self._bytes,
+            "dirty":   self.dirty_count(),
+            "hits":    self.hits,
+            "misses":  self.misses,
+            **({"reloads": self.reloads, "rebases": self.rebases} if self.shared else {}),
+        }
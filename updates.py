@@ -0,0 +1,90 @@
+"""
+Webhook ingestion queue for Telegram updates.
+
+/webhook used to run the bot handlers before answering, so a slow handler
+delayed the 200 past Telegram's patience and the update was delivered (and
+processed) again. Now the webhook only hands the update to UpdateQueue and
+returns:
+
+    offer() → "queued"     accepted, will be processed
+              "duplicate"  update_id seen recently — a redelivery, dropped
+              "full"       too many updates pending; answer 503 so Telegram retries
+
+Updates are sharded over `workers` worker tasks by chat, so one chat's
+updates are handled in the order they arrived while different chats proceed
+in parallel. The dedupe window remembers the last `window` accepted
+update_ids; a rejected ("full") update is not remembered, so its retry gets in.
+"""
+import asyncio, logging
+from collections import deque
+
+
+class UpdateQueue:
+    def __init__(self, process, workers: int = 8, max_pending: int = 1000, window: int = 10000):
+        """process(update) → awaitable that handles one update (Application.process_update)."""
+        self._process    = process
+        self.workers     = workers
+        self.max_pending = max_pending
+        self.window      = window
+        self._shards     = []
+        self._tasks      = []
+        self._seen       = set()
+        self._order      = deque()
+        self.pending     = 0
+        self.processed   = 0
+        self.failed      = 0
+        self.duplicates  = 0
+        self.rejected    = 0
+
+    def start(self):
+        self._shards = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks  = [asyncio.create_task(self._worker(q)) for q in self._shards]
+
+    async def stop(self, drain: float = 5.0):
+        """Give pending updates up to `drain` seconds to finish, then cancel the workers."""
+        if self._shards:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._shards)), drain)
+            except asyncio.TimeoutError:
+                logging.warning(f"UpdateQueue: {self.pending} updates dropped at shutdown")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._shards = [], []
+
+    # ── Ingestion ─────────────────────────────────────────────────────────────
+
+    def _remember(self, update_id: int):
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        while len(self._order) > self.window:
+            self._seen.discard(self._order.popleft())
+
+    def offer(self, update_id: int, chat_key, update) -> str:
+        if update_id in self._seen:
+            self.duplicates += 1
+            return "duplicate"
+        if not self._shards or self.pending >= self.max_pending:
+            self.rejected += 1
+            return "full"
+        self._remember(update_id)
+        self.pending += 1
+        self._shards[hash(chat_key) % len(self._shards)].put_nowait(update)
+        return "queued"
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self._process(update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logging.exception("UpdateQueue: update processing failed")
+            finally:
+                self.pending -= 1
+                queue.task_done()
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "pending": self.pending, "processed": self.processed,
+                "failed": self.failed, "duplicates": self.duplicates, "rejected": self.rejected}
@@ -0,0 +1,212 @@
+"""
+Upload reference index and orphan sweeper.
+
+Nothing used to link data/uploads back to the trips pointing at it, so a file
+whose ref, booking or flight was deleted stayed on disk forever. This module
+keeps an index in SQLite (data/uploads.db, outside the served directory):
+
+    uploads  every upload: chat, url, original name, size, time
+    blobs    blobs stored since the index exists; unref_since is set while no
+             chat references the blob
+    refs     (chat, url) for every /uploads/... string in a chat's document
+
+refs is maintained by a TripStore listener. On each save the document's
+/uploads/ URLs are collected and compared with the set from the previous
+save; only a difference reaches the database, written in the background.
+Saves whose ops only add values without upload URLs skip the walk entirely.
+
+sweep() is incremental. Each call looks at no more than `batch` of the oldest
+unreferenced blobs, through the partial index on unref_since, and deletes
+those that have been unreferenced for longer than `grace`. Deleting a blob
+also deletes its preview variants. The grace period covers the gap between
+an upload and the save that references it. A blob that was uploaded again
+(deduplicated, which touches its mtime) within the grace period is kept.
+Only blobs registered here are ever deleted. Files that predate the index
+are left alone.
+"""
+import asyncio, logging, sqlite3, threading, time
+from pathlib import Path
+
+PREFIX = "/uploads/"
+
+
+def upload_urls(data) -> set:
+    """Every /uploads/... string anywhere in a document."""
+    out, stack = set(), [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            if node.startswith(PREFIX):
+                out.add(node.split("?", 1)[0])
+        elif isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return out
+
+
+def _adds_no_uploads(ops) -> bool:
+    return ops is not None and all(op.get("op") == "add" and not upload_urls(op.get("value"))
+                                   for op in ops)
+
+
+class UploadIndex:
+    def __init__(self, db_path, uploads_dir: Path, run, grace: float = 86400.0,
+                 lock=None, extra_files=None):
+        """
+        run(fn, *args) → awaitable running blocking work off the loop (IOPool.run).
+        lock is held while a blob is checked and deleted (BlobStore.lock, so a
+        concurrent deduplicating upload can't reuse it mid-delete); extra_files(path)
+        lists derived files to delete with a blob (preview variants).
+        """
+        self.db_path     = Path(db_path)
+        self.root        = Path(uploads_dir)
+        self.grace       = grace
+        self._run        = run
+        self._lock       = lock or threading.Lock()
+        self._extra      = extra_files or (lambda path: [])
+        self._local      = threading.local()
+        self._known: dict = {}      # chat key → URL set last written
+        self._dirty: dict = {}      # chat key → URL set waiting to be written
+        self._writer     = None
+        self.swept       = 0
+        self.reclaimed   = 0
+        self.last_sweep  = None
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS uploads (id INTEGER PRIMARY KEY, chat TEXT NOT NULL,
+                    url TEXT NOT NULL, name TEXT, size INTEGER NOT NULL, ts REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS blobs (url TEXT PRIMARY KEY, size INTEGER NOT NULL,
+                    created REAL NOT NULL, unref_since REAL);
+                CREATE INDEX IF NOT EXISTS blobs_unref ON blobs (unref_since) WHERE unref_since IS NOT NULL;
+                CREATE TABLE IF NOT EXISTS refs (chat TEXT NOT NULL, url TEXT NOT NULL, PRIMARY KEY (chat, url));
+                CREATE INDEX IF NOT EXISTS refs_url ON refs (url);
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _path(self, url: str) -> Path:
+        return self.root / url[len(PREFIX):]
+
+    # ── Uploads ───────────────────────────────────────────────────────────────
+
+    def _register(self, chat: str, url: str, name: str, size: int, new: bool):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT INTO uploads (chat, url, name, size, ts) VALUES (?, ?, ?, ?, ?)",
+                         (chat, url, name, size, now))
+            if new:
+                referenced = conn.execute("SELECT 1 FROM refs WHERE url = ? LIMIT 1", (url,)).fetchone()
+                conn.execute("INSERT OR IGNORE INTO blobs (url, size, created, unref_since) VALUES (?, ?, ?, ?)",
+                             (url, size, now, None if referenced else now))
+
+    async def register(self, chat_id, stored: dict, name: str):
+        """Record an upload (BlobStore.store() result); new blobs become eligible for sweeping."""
+        await self._run(self._register, str(chat_id), stored["url"], name,
+                        stored["size"], not stored["deduplicated"])
+
+    # ── References (TripStore listener) ───────────────────────────────────────
+
+    def on_change(self, key: str, data: dict, ops):
+        if key in self._known and _adds_no_uploads(ops):
+            return
+        urls = upload_urls(data)
+        if self._known.get(key) == urls:
+            return
+        self._known[key] = urls
+        self._dirty[key] = urls
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write_dirty())
+
+    def forget(self, key: str):
+        """Drop a chat's cached URL set (its refs stay in the database; pending writes still go)."""
+        self._known.pop(key, None)
+
+    async def _write_dirty(self):
+        while self._dirty:
+            key  = next(iter(self._dirty))
+            urls = self._dirty.pop(key)
+            try:
+                await self._run(self._sync, key, urls)
+            except Exception:
+                self._known.pop(key, None)      # re-diff against the database next save
+                logging.exception(f"UploadIndex: could not update refs of chat {key}")
+
+    def _sync(self, chat: str, urls: set):
+        conn    = self._conn()
+        current = {u for (u,) in conn.execute("SELECT url FROM refs WHERE chat = ?", (chat,))}
+        added, removed = urls - current, current - urls
+        if not added and not removed:
+            return
+        now = time.time()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO refs (chat, url) VALUES (?, ?)", [(chat, u) for u in added])
+            conn.executemany("DELETE FROM refs WHERE chat = ? AND url = ?", [(chat, u) for u in removed])
+            conn.executemany("UPDATE blobs SET unref_since = NULL WHERE url = ?", [(u,) for u in added])
+            conn.executemany("UPDATE blobs SET unref_since = ? WHERE url = ? AND unref_since IS NULL "
+                             "AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.url = blobs.url)",
+                             [(now, u) for u in removed])
+
+    # ── Sweeping ──────────────────────────────────────────────────────────────
+
+    def _sweep(self, batch: int) -> dict:
+        conn   = self._conn()
+        cutoff = time.time() - self.grace
+        rows   = conn.execute("SELECT url FROM blobs WHERE unref_since IS NOT NULL AND unref_since < ? "
+                              "ORDER BY unref_since LIMIT ?", (cutoff, batch)).fetchall()
+        deleted, freed = 0, 0
+        for (url,) in rows:
+            path = self._path(url)
+            with self._lock:
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    st = None
+                if st is not None and st.st_mtime >= cutoff:
+                    # Uploaded again recently — give it a fresh grace period
+                    with conn:
+                        conn.execute("UPDATE blobs SET unref_since = ? WHERE url = ?", (st.st_mtime, url))
+                    continue
+                with conn:
+                    gone = conn.execute("DELETE FROM blobs WHERE url = ? AND unref_since < ? AND NOT EXISTS "
+                                        "(SELECT 1 FROM refs WHERE refs.url = blobs.url)", (url, cutoff)).rowcount
+                if not gone:
+                    continue
+                for f in [path, *self._extra(path)]:
+                    try:
+                        size = f.stat().st_size
+                        f.unlink()
+                        freed += size
+                    except FileNotFoundError:
+                        pass
+                deleted += 1
+        return {"deleted": deleted, "bytes": freed}
+
+    async def sweep(self, batch: int = 100) -> dict:
+        """Delete up to `batch` blobs unreferenced for longer than the grace period."""
+        result = await self._run(self._sweep, batch)
+        self.swept      += result["deleted"]
+        self.reclaimed  += result["bytes"]
+        self.last_sweep  = int(time.time())
+        if result["deleted"]:
+            logging.info(f"UploadIndex: removed {result['deleted']} orphaned uploads, "
+                         f"{result['bytes']} bytes reclaimed")
+        return result
+
+    async def sweep_forever(self, interval: float, batch: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep(batch)
+            except Exception:
+                logging.exception("UploadIndex: sweep failed")
+
+    def stats(self) -> dict:
+        return {"chats_tracked": len(self._known), "swept": self.swept,
+                "reclaimed_bytes": self.reclaimed, "last_sweep": self.last_sweep}
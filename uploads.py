@@ -0,0 +1,103 @@
+"""
+Content-addressed upload storage.
+
+Uploads are streamed chunk by chunk to a temp file while being hashed
+(SHA-256), with the size limit enforced as the bytes arrive, and then moved
+to
+
+    data/uploads/blobs/<h[:2]>/<h><ext>      served as /uploads/blobs/<h[:2]>/<h><ext>
+
+If a blob with that hash already exists the temp file is dropped and the
+existing blob is reused, so the same boarding pass uploaded by six members is
+stored once. Which chat uploaded what is recorded by the upload index (see
+uploadgc.py), which also deletes blobs no trip references any more.
+
+All file I/O and hashing run through `run` (IOPool.run), off the event loop.
+"""
+import hashlib, os, threading, uuid
+from pathlib import Path
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class BlobStore:
+    def __init__(self, uploads_dir: Path, tmp_dir: Path, run, max_bytes: int):
+        self.root      = Path(uploads_dir)
+        self.blobs     = self.root / "blobs"
+        self.tmp       = Path(tmp_dir)
+        self.max_bytes = max_bytes
+        self.lock      = threading.Lock()      # held while a blob is reused or deleted
+        self._run      = run
+        for d in (self.blobs, self.tmp):
+            d.mkdir(parents=True, exist_ok=True)
+        self.stored    = 0
+        self.deduped   = 0
+
+    # ── Blocking helpers (run on the I/O pool) ────────────────────────────────
+
+    @staticmethod
+    def _append(f, hasher, chunk: bytes):
+        hasher.update(chunk)
+        f.write(chunk)
+
+    def _finish(self, tmp: Path, digest: str, ext: str):
+        """Move tmp into place, or drop it if the blob already exists. Returns (path, deduped)."""
+        shard = self.blobs / digest[:2]
+        shard.mkdir(exist_ok=True)
+        with self.lock:
+            existing = next((p for p in shard.iterdir() if p.name.split(".", 1)[0] == digest), None)
+            if existing is not None:
+                tmp.unlink(missing_ok=True)
+                os.utime(existing)          # restarts the sweeper's grace period
+                return existing, True
+            dest = shard / f"{digest}{ext}"
+            os.replace(tmp, dest)
+            return dest, False
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def url_for(self, path: Path) -> str:
+        return "/uploads/" + path.relative_to(self.root).as_posix()
+
+    async def store(self, original_name: str, chunks) -> dict:
+        """
+        Consume an async iterator of byte chunks into a blob.
+        Raises UploadTooLarge as soon as more than max_bytes have arrived.
+        """
+        ext    = Path(original_name or "file").suffix.lower()[:16]
+        tmp    = self.tmp / f"upload_{uuid.uuid4().hex}"
+        hasher = hashlib.sha256()
+        size   = 0
+        f      = await self._run(open, tmp, "wb")
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadTooLarge(size)
+                await self._run(self._append, f, hasher, chunk)
+        except BaseException:
+            await self._run(f.close)
+            await self._run(tmp.unlink, True)
+            raise
+        await self._run(f.close)
+
+        digest = hasher.hexdigest()
+        path, deduped = await self._run(self._finish, tmp, digest, ext)
+        if deduped:
+            self.deduped += 1
+        else:
+            self.stored += 1
+        return {"url": self.url_for(path), "path": path, "sha256": digest, "size": size, "deduplicated": deduped}
+
+    def stats(self) -> dict:
+        return {"stored": self.stored, "deduplicated": self.deduped, "max_bytes": self.max_bytes}
+
+
+async def iter_upload(upload, chunk_size: int = 1 << 20):
+    """Async chunk iterator over a Starlette UploadFile."""
+    while chunk := await upload.read(chunk_size):
+        yield chunk
@@ -0,0 +1,166 @@
+"""
+Server-side forecast proxy for the Weather tab.
+
+One /api/weather call replaces the per-location requests every member's
+phone used to make to api.open-meteo.com. Forecasts are cached by location
+rounded to ~1 km (0.01°) for `ttl` seconds and shared by all chats; the
+locations of a request that are not cached go upstream together in one
+batched call, and a location already being fetched by another request is
+awaited rather than fetched twice.
+
+The upstream is a provider object with a single coroutine,
+
+    fetch(coords: list[(lat, lon)]) → list[daily dict]   (same order as coords)
+
+where a daily dict has Open-Meteo's shape: {"time": [...], "<variable>": [...]}.
+OpenMeteoProvider talks to the real API; StubForecastProvider returns
+deterministic data for offline runs and tests.
+"""
+import asyncio, datetime, logging, time, zlib
+import httpx
+
+DAILY_VARS = ("temperature_2m_max", "temperature_2m_min", "precipitation_probability_max",
+              "precipitation_sum", "weather_code", "wind_speed_10m_max", "snowfall_sum")
+FORECAST_DAYS = 14
+
+
+class OpenMeteoProvider:
+    URL = "https://api.open-meteo.com/v1/forecast"
+
+    def __init__(self, timeout: float = 10.0):
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def fetch(self, coords: list) -> list:
+        params = {
+            "latitude":        ",".join(str(lat) for lat, _ in coords),
+            "longitude":       ",".join(str(lon) for _, lon in coords),
+            "daily":           ",".join(DAILY_VARS),
+            "timezone":        "auto",
+            "wind_speed_unit": "kmh",
+            "forecast_days":   FORECAST_DAYS,
+        }
+        r = await self._client.get(self.URL, params=params)
+        r.raise_for_status()
+        body = r.json()
+        # A single location comes back as one object, several as a list
+        return [b["daily"] for b in (body if isinstance(body, list) else [body])]
+
+
+class StubForecastProvider:
+    """Deterministic, offline forecasts — same input, same output."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def fetch(self, coords: list) -> list:
+        self.calls += 1
+        today = datetime.date.today()
+        out   = []
+        for lat, lon in coords:
+            seed  = zlib.crc32(f"{lat},{lon}".encode())
+            days  = [today + datetime.timedelta(days=i) for i in range(FORECAST_DAYS)]
+            daily = {"time": [d.isoformat() for d in days]}
+            for i, var in enumerate(DAILY_VARS):
+                daily[var] = [((seed >> (i + j)) % 30) for j in range(FORECAST_DAYS)]
+            out.append(daily)
+        return out
+
+
+def _key(lat, lon) -> tuple:
+    return round(float(lat), 2), round(float(lon), 2)
+
+
+def _in_range(daily: dict, date_from: str, date_to: str) -> dict:
+    """Only the days within [date_from, date_to]; everything if no range is set."""
+    if not date_from:
+        return daily
+    date_to = date_to or date_from
+    keep    = [i for i, d in enumerate(daily.get("time", [])) if date_from <= d <= date_to]
+    return {k: [v[i] for i in keep] for k, v in daily.items() if isinstance(v, list)}
+
+
+class ForecastCache:
+    def __init__(self, provider, ttl: float = 1800.0, max_entries: int = 4096):
+        self.provider    = provider
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self._cache: dict    = {}       # key → (expires_at, daily)
+        self._inflight: dict = {}       # key → Future[daily]
+        self.hits      = 0
+        self.misses    = 0
+        self.upstream  = 0
+
+    async def _get_many(self, keys: list) -> dict:
+        now, out, waits, todo = time.monotonic(), {}, {}, []
+        for key in dict.fromkeys(keys):
+            hit = self._cache.get(key)
+            if hit and hit[0] > now:
+                self.hits += 1
+                out[key] = hit[1]
+            elif key in self._inflight:
+                self.hits += 1
+                waits[key] = self._inflight[key]
+            else:
+                self.misses += 1
+                todo.append(key)
+
+        if todo:
+            loop = asyncio.get_running_loop()
+            futs = {k: loop.create_future() for k in todo}
+            self._inflight.update(futs)
+            try:
+                self.upstream += 1
+                results = await self.provider.fetch(todo)
+                if len(results) != len(todo):
+                    raise ValueError(f"provider returned {len(results)} forecasts for {len(todo)} locations")
+                expires = time.monotonic() + self.ttl
+                for k, daily in zip(todo, results):
+                    self._cache[k] = (expires, daily)
+                    futs[k].set_result(daily)
+                    out[k] = daily
+                self._trim()
+            except Exception as e:
+                for f in futs.values():
+                    if not f.done():
+                        f.set_exception(e)
+                        f.exception()       # mark retrieved, so a future nobody awaits doesn't warn
+                raise
+            finally:
+                for k in todo:
+                    self._inflight.pop(k, None)
+
+        for key, fut in waits.items():
+            out[key] = await fut
+        return out
+
+    def _trim(self):
+        if len(self._cache) <= self.max_entries:
+            return
+        now = time.monotonic()
+        for k in [k for k, (exp, _) in self._cache.items() if exp <= now]:
+            del self._cache[k]
+        while len(self._cache) > self.max_entries:
+            del self._cache[next(iter(self._cache))]
+
+    async def for_locations(self, locations: list) -> list:
+        """Forecast for each of a trip's wxLocations, cut to its dateFrom/dateTo."""
+        keys = []
+        for loc in locations:
+            try:
+                keys.append(_key(loc["lat"], loc["lon"]))
+            except (KeyError, TypeError, ValueError):
+                keys.append(None)
+        daily = await self._get_many([k for k in keys if k is not None])
+        return [{"daily": _in_range(daily[key], loc.get("dateFrom"), loc.get("dateTo"))} if key else None
+                for loc, key in zip(locations, keys)]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._cache), "hits": self.hits,
+                "misses": self.misses, "upstream_calls": self.upstream}
+
+
+def make_provider(name: str):
+    if name == "stub":
+        logging.info("weather: using the offline stub forecast provider")
+        return StubForecastProvider()
+    return OpenMeteoProvider()